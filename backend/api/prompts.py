@@ -1,32 +1,68 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
 from backend.api.auth import get_current_user  # Import the dependency
+from backend.config import settings
 from backend.models import User  # Added for type hinting current_user
-from backend.models import (Prompt, PromptCreate, PromptUpdate, SearchRequest,
-                            SearchResponse)
+from backend.models import (Prompt, PromptCreate, PromptListItem, PromptRecord,
+                            PromptUpdate, SearchRequest, SearchResponse)
+from backend.services.prompt_query import PromptFilter
 from backend.services.prompt_service import PromptService
 
 router = APIRouter(prefix="/prompts", tags=["prompts"])
 prompt_service = PromptService()  # Instantiate PromptService
 
 
-@router.get("/", response_model=List[Prompt])
+@router.get("/", response_model=List[PromptListItem], response_model_exclude_unset=True)
 async def list_prompts(
+    response: Response,
     status: Optional[str] = Query(None, description="过滤状态"),
     tag: Optional[str] = Query(None, description="过滤标签"),
+    creator_username: Optional[str] = Query(None, description="过滤创建者"),
+    q: Optional[str] = Query(None, description="标题/标签/内容包含的文本（不区分大小写）"),
+    fields: Optional[str] = Query(
+        None, description="只返回指定字段，逗号分隔（如 title,tags,status,usage_count）；不含content时不加载内容"
+    ),
+    limit: Optional[int] = Query(
+        None, ge=1, le=settings.PROMPT_LIST_PAGE_SIZE_MAX, description="每页条数，不指定时返回全部"
+    ),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
 ):
-    """获取所有prompts"""
-    prompts = await prompt_service.storage_service.list_prompts()
+    """获取prompts，按更新时间从新到旧排列。
+
+    指定limit时分页返回，响应头 X-Next-Cursor 为下一页游标（没有下一页时不返回），
+    X-Total-Count 为满足条件的总数（翻页期间目录变化时为近似值）。
+    """
+    selected = None
+    if fields:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(selected) - set(PromptRecord.FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知字段: {', '.join(sorted(unknown))}")
+        selected = list(dict.fromkeys(["title"] + selected))
+
+    # 过滤和分页在存储层完成；存储层返回轻量的PromptRecord，由response_model在响应时转换
+    try:
+        page = await prompt_service.storage_service.query_prompts(
+            PromptFilter(status=status or None, tag=tag or None, creator_username=creator_username or None, q=q),
+            cursor=cursor,
+            limit=limit,
+            # 需要序列化content时直接取完整记录，响应时不会触发同步的延迟加载
+            include_content=selected is None or "content" in selected,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 应用过滤
-    if status:
-        prompts = [p for p in prompts if p.status == status]
-    if tag:
-        prompts = [p for p in prompts if p.tags and tag in p.tags] # Added check for p.tags existence
+    if page.total is not None:
+        response.headers["X-Total-Count"] = str(page.total)
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
 
-    return prompts
+    if selected is not None:
+        # 只序列化所选字段
+        return [p.to_dict(selected) for p in page.prompts]
+    return page.prompts
 
 
 @router.get("/tags/", response_model=List[str])
@@ -99,9 +135,16 @@ async def delete_prompt(title: str, current_user: User = Depends(get_current_use
 @router.post("/search", response_model=SearchResponse)
 async def search_prompts(request: SearchRequest):
     """搜索prompts"""
-    results = await prompt_service.storage_service.search_prompts(request.query, request.search_in)
+    page = await prompt_service.storage_service.search_prompts_page(
+        request.query,
+        request.search_in,
+        ranking=request.ranking,
+        limit=request.limit,
+        offset=request.offset,
+        enabled_only=request.enabled_only,
+    )
     return SearchResponse(
-        results=results[: request.limit], total=len(results), query=request.query
+        results=[prompt for _, prompt in page.hits], total=page.total, query=request.query
     )
 
 
@@ -5,7 +5,7 @@ from datetime import datetime
 from typing import List
 
 from sqlalchemy import (
-    Boolean, Column, DateTime, ForeignKey, Integer, String, Text, JSON, Index
+    BigInteger, Boolean, Column, DateTime, ForeignKey, Integer, String, Text, JSON, Index, desc
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
@@ -60,6 +60,11 @@ class Prompt(Base):
     creator: Mapped["User"] = relationship("User", back_populates="prompts")
     tags: Mapped[List["Tag"]] = relationship("Tag", secondary="prompt_tags", back_populates="prompts")
 
+    # 列表按 (updated_at 降序, title 升序) 键集分页，索引列方向与排序一致
+    __table_args__ = (
+        Index('idx_prompts_updated_desc_title', desc('updated_at'), 'title'),
+    )
+
 
 class PromptTag(Base):
     """提示词标签关联表"""
@@ -72,4 +77,29 @@ class PromptTag(Base):
     # 创建复合唯一索引
     __table_args__ = (
         Index('idx_prompt_tag_unique', 'prompt_id', 'tag_id', unique=True),
-    )
\ No newline at end of file
+    )
+
+class CatalogState(Base):
+    """提示词目录版本表（单行），任何提示词增删改都会递增version，用于跨进程的缓存失效"""
+    __tablename__ = "catalog_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class SearchFieldStats(Base):
+    """BM25字段统计（每个可搜索文本字段一行）：文档数与字段总长度，随提示词增删改在同一事务中增量维护"""
+    __tablename__ = "search_field_stats"
+
+    field: Mapped[str] = mapped_column(String(16), primary_key=True)
+    doc_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    length_total: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class SearchTermStats(Base):
+    """BM25 n-gram文档频率：该字段（小写后）包含此单字/二元字符组的提示词数"""
+    __tablename__ = "search_term_stats"
+
+    field: Mapped[str] = mapped_column(String(16), primary_key=True)
+    gram: Mapped[str] = mapped_column(String(8), primary_key=True)
+    df: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
@@ -22,6 +22,42 @@ async def startup_sync_tags():
         print(f"Error during startup tag sync: {e}")
 
 
+# 文件存储模式下监听prompt-template目录，增量更新内存缓存
+@app.on_event("startup")
+async def startup_prompt_watcher():
+    if settings.USE_DATABASE:
+        return
+    from backend.services.prompt_catalog import get_prompt_catalog
+    from backend.services.prompt_watcher import start_prompt_watcher
+
+    start_prompt_watcher(get_prompt_catalog(settings.PROMPT_TEMPLATE_DIR))
+
+
+@app.on_event("shutdown")
+async def shutdown_prompt_watcher():
+    from backend.services.prompt_watcher import stop_prompt_watchers
+
+    await stop_prompt_watchers()
+
+
+# 同进程挂载MCP服务：与后端共用prompt目录、搜索索引、使用次数记录器和数据库连接池
+if settings.MCP_EMBEDDED:
+    from mcp_server.server import app as mcp_app
+    from mcp_server.server import start_background_tasks, stop_background_tasks
+
+    app.mount(settings.MCP_EMBEDDED_PATH, mcp_app)
+
+    # 挂载的子应用不会执行自己的startup/shutdown事件，由后端代为启停
+    @app.on_event("startup")
+    async def startup_mcp_server():
+        await start_background_tasks()
+        print(f"MCP server mounted at {settings.MCP_EMBEDDED_PATH}/mcp")
+
+    @app.on_event("shutdown")
+    async def shutdown_mcp_server():
+        await stop_background_tasks()
+
+
 # CORS配置
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +65,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],  # GET /prompts 分页信息
 )
 
 # 注册路由
@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Literal, Optional
 
 from pydantic import BaseModel, Field, validator
 
@@ -37,6 +37,103 @@ class Prompt(PromptBase):
         from_attributes = True
 
 
+class PromptListItem(BaseModel):
+    """列表接口返回项：请求指定fields时只包含所选字段（未选字段不出现在响应中）"""
+
+    title: str
+    content: Optional[str] = None
+    tags: Optional[List[str]] = None
+    remark: Optional[str] = None
+    status: Optional[str] = None
+    creator_username: Optional[str] = None
+    usage_count: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    file_path: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PromptRecord:
+    """存储层与服务层内部使用的轻量prompt记录（__slots__，构造时不做校验）。
+
+    API响应时才转换为Prompt：路由的response_model按属性读取记录（Prompt开启了from_attributes）。
+    只含元数据的记录（列表投影）不带content：提供了content_loader时在首次访问时同步加载，
+    否则访问content抛出AttributeError。加载可能读取文件，异步代码中不应访问元数据记录的content，
+    需要content时应向存储层请求完整记录（include_content=True）。
+    """
+
+    FIELDS = (
+        "title", "content", "tags", "remark", "status", "creator_username",
+        "usage_count", "created_at", "updated_at", "file_path",
+    )
+    __slots__ = FIELDS + ("_content_loader",)
+
+    def __init__(
+        self,
+        title: str,
+        content: Optional[str],
+        tags: List[str],
+        remark: Optional[str] = None,
+        status: Optional[str] = None,
+        creator_username: Optional[str] = None,
+        usage_count: int = 0,
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None,
+        file_path: str = "",
+        content_loader: Optional[Callable[[], str]] = None,
+    ):
+        self.title = title
+        if content is not None:
+            self.content = content
+        self.tags = tags
+        self.remark = remark
+        self.status = status
+        self.creator_username = creator_username
+        self.usage_count = usage_count
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.file_path = file_path
+        self._content_loader = content_loader
+
+    def __getattr__(self, name: str) -> Any:
+        # 只在slot未赋值时调用：延迟加载content
+        if name == "content" and self._content_loader is not None:
+            self.content = self._content_loader()
+            self._content_loader = None
+            return self.content
+        raise AttributeError(f"'PromptRecord' object has no attribute '{name}'")
+
+    @property
+    def has_content(self) -> bool:
+        """content是否已在内存中（不触发加载）"""
+        try:
+            object.__getattribute__(self, "content")
+        except AttributeError:
+            return False
+        return True
+
+    def without_content(self, content_loader: Optional[Callable[[], str]] = None) -> "PromptRecord":
+        """只含元数据的副本，不引用原记录的content"""
+        data = {field: getattr(self, field) for field in self.FIELDS if field != "content"}
+        return PromptRecord(content=None, content_loader=content_loader, **data)
+
+    def to_model(self) -> Prompt:
+        """转换为（经过校验的）Pydantic模型"""
+        return Prompt.model_validate(self)
+
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """转换为字典；指定fields时只包含这些字段"""
+        data = {field: getattr(self, field) for field in (fields or self.FIELDS)}
+        if "tags" in data:
+            data["tags"] = list(self.tags)  # 记录可能被缓存共享，返回副本
+        return data
+
+    def __repr__(self) -> str:
+        return f"PromptRecord(title={self.title!r}, status={self.status!r})"
+
+
 class PromptOptimizeRequest(BaseModel):
     content: str = Field(..., description="需要优化的prompt内容")
     context: Optional[str] = Field(None, description="上下文信息")
@@ -55,6 +152,11 @@ class SearchRequest(BaseModel):
         default=["title", "tags", "content"], description="搜索范围"
     )
     limit: int = Field(default=20, ge=1, le=100)
+    offset: int = Field(default=0, ge=0)
+    enabled_only: bool = Field(default=False, description="只返回启用的prompt")
+    ranking: Literal["priority", "bm25"] = Field(
+        default="priority", description="排序方式：priority（标题>标签>内容）或 bm25（相关度）"
+    )
 
 
 class SearchResponse(BaseModel):
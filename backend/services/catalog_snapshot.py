@@ -0,0 +1,581 @@
+"""
+共享目录快照 - 启用的prompt及其n-gram倒排索引写成只读二进制文件，由各worker进程mmap读取
+
+多worker部署时只有一个进程（持有锁文件者）维护目录并写快照，其余进程不加载目录，
+直接在映射的文件上查找和搜索，各进程共享同一份页缓存。
+
+文件布局（小端）：
+  头部     MAGIC, 代数, 目录版本, 文档数, 各字段总长度, 各字段gram表偏移与条数
+  键表     每个文档一条，按键排序：键、JSON记录的位置，各字段长度，记录CRC32
+  gram表   每个字段一张，按gram的UTF-8字节排序：gram位置、倒排表位置与条数
+  倒排表   (文档序号, 词频)，按文档序号升序
+  字符串区 键、JSON记录与gram
+快照总是整体写入临时文件后os.replace，代数逐次递增；读取方发现文件被替换且代数更大时重新映射。
+"""
+import asyncio
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend.config import settings
+from backend.models import PromptRecord
+from backend.services.prompt_catalog import ChangeListener, ChangeType, PromptChange
+from backend.services.search_index import index_document, match_score
+from backend.services.search_scoring import (BM25_FIELD_WEIGHTS, FIELD_SCORES, RANKING_BM25,
+                                             RANKING_PRIORITY, SearchPage, SearchProgress,
+                                             bm25_idf, bm25_tf, query_grams, rank_scored)
+from backend.utils.file_utils import FileSignature, write_bytes_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持多worker共享，当前进程总是写入方
+    fcntl = None
+
+MAGIC = b"PTSNAP01"
+FIELDS = tuple(field for field, _ in FIELD_SCORES)
+
+# magic, 代数, 目录版本（-1表示未知）, 文档数, 各字段总长度×3, 各字段gram表偏移×3, 各字段gram数×3
+_HEADER = struct.Struct("<8sQqI3Q3Q3I")
+# 键偏移, 键长度, 记录偏移, 记录长度, 各字段长度×3, 记录CRC32
+_KEY = struct.Struct("<QIQI3II")
+# gram偏移, gram长度, 倒排表偏移, 倒排条数
+_GRAM = struct.Struct("<QIQI")
+# 文档序号, 词频
+_POSTING = struct.Struct("<II")
+
+_DATETIME_FIELDS = ("created_at", "updated_at")
+# 记录CRC只覆盖这些字段：使用次数的变化不算prompt变更，读取方不会为此推送MODIFIED
+_CRC_FIELDS = tuple(field for field in PromptRecord.FIELDS if field != "usage_count")
+
+
+def _encode_record(prompt: PromptRecord, fields: Tuple[str, ...] = PromptRecord.FIELDS) -> bytes:
+    data = prompt.to_dict(fields)
+    for field in _DATETIME_FIELDS:
+        if data.get(field) is not None:
+            data[field] = data[field].isoformat()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _decode_record(raw: bytes) -> PromptRecord:
+    data = json.loads(raw)
+    for field in _DATETIME_FIELDS:
+        if data[field] is not None:
+            data[field] = datetime.fromisoformat(data[field])
+    return PromptRecord(**data)
+
+
+def build_snapshot(entries: List[Tuple[str, PromptRecord]], generation: int, catalog_version: Optional[int]) -> bytes:
+    """把 (键, prompt) 列表编码为快照文件内容"""
+    entries = sorted(entries, key=lambda entry: entry[0])
+    docs = []
+    postings: Dict[str, Dict[str, array]] = {field: {} for field in FIELDS}
+    totals = dict.fromkeys(FIELDS, 0)
+    for doc_no, (key, prompt) in enumerate(entries):
+        lengths, grams = index_document(prompt)
+        for field in FIELDS:
+            totals[field] += lengths[field]
+            field_postings = postings[field]
+            for gram, tf in grams[field].items():
+                field_postings.setdefault(gram, array("I")).extend((doc_no, tf))
+        crc = zlib.crc32(_encode_record(prompt, _CRC_FIELDS))
+        docs.append((key.encode("utf-8"), _encode_record(prompt), lengths, crc))
+
+    # UTF-8字节序与码点顺序一致，读取时可直接按字节二分查找
+    gram_tables = {
+        field: sorted((gram.encode("utf-8"), pairs) for gram, pairs in postings[field].items())
+        for field in FIELDS
+    }
+
+    offset = _HEADER.size + len(docs) * _KEY.size
+    gram_offsets = []
+    for field in FIELDS:
+        gram_offsets.append(offset)
+        offset += len(gram_tables[field]) * _GRAM.size
+    posting_offset = offset
+    offset += sum(len(pairs) for table in gram_tables.values() for _, pairs in table) // 2 * _POSTING.size
+    buf = bytearray(offset)
+
+    def put(data: bytes) -> int:
+        position = len(buf)
+        buf.extend(data)
+        return position
+
+    _HEADER.pack_into(
+        buf, 0, MAGIC, generation, -1 if catalog_version is None else catalog_version, len(docs),
+        *(totals[field] for field in FIELDS), *gram_offsets, *(len(gram_tables[field]) for field in FIELDS),
+    )
+    for doc_no, (key, record, lengths, crc) in enumerate(docs):
+        _KEY.pack_into(
+            buf, _HEADER.size + doc_no * _KEY.size, put(key), len(key), put(record), len(record),
+            *(lengths[field] for field in FIELDS), crc,
+        )
+    for field, table_offset in zip(FIELDS, gram_offsets):
+        for i, (gram, pairs) in enumerate(gram_tables[field]):
+            if sys.byteorder != "little":
+                pairs.byteswap()
+            data = pairs.tobytes()
+            buf[posting_offset:posting_offset + len(data)] = data
+            _GRAM.pack_into(buf, table_offset + i * _GRAM.size, put(gram), len(gram), posting_offset, len(pairs) // 2)
+            posting_offset += len(data)
+    return bytes(buf)
+
+
+def read_generation(path: Path) -> int:
+    """现有快照的代数，文件不存在或无法识别时返回0"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return 0
+    if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+        return 0
+    return _HEADER.unpack(header)[1]
+
+
+def write_snapshot(path: Path, entries: List[Tuple[str, PromptRecord]], catalog_version: Optional[int]) -> int:
+    """原子写入新快照，返回其代数"""
+    generation = read_generation(path) + 1
+    write_bytes_atomic(path, build_snapshot(entries, generation, catalog_version))
+    return generation
+
+
+class CatalogSnapshot:
+    """一个已映射的快照文件（只读）。不再被引用时由GC解除映射，进行中的请求可继续使用旧快照。"""
+
+    def __init__(self, path: Path, prompt_cache_size: int = settings.CATALOG_SNAPSHOT_PROMPT_CACHE):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.signature: FileSignature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buf) < _HEADER.size or self._buf[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a catalog snapshot: {path}")
+        header = _HEADER.unpack_from(self._buf, 0)
+        self.generation = header[1]
+        self.catalog_version = None if header[2] < 0 else header[2]
+        self._count = header[3]
+        self._field_length_totals = dict(zip(FIELDS, header[4:7]))
+        self._gram_tables = dict(zip(FIELDS, zip(header[7:10], header[10:13])))
+        # 每个进程只缓存最近用到的已解码prompt
+        self.prompt = lru_cache(maxsize=prompt_cache_size)(self._decode_prompt)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, doc_no: int) -> tuple:
+        return _KEY.unpack_from(self._buf, _HEADER.size + doc_no * _KEY.size)
+
+    def _key_bytes(self, doc_no: int) -> bytes:
+        offset, length = _KEY.unpack_from(self._buf, _HEADER.size + doc_no * _KEY.size)[:2]
+        return self._buf[offset:offset + length]
+
+    def key(self, doc_no: int) -> str:
+        return self._key_bytes(doc_no).decode("utf-8")
+
+    def checksum(self, doc_no: int) -> int:
+        return self._entry(doc_no)[7]
+
+    def _decode_prompt(self, doc_no: int) -> PromptRecord:
+        entry = self._entry(doc_no)
+        return _decode_record(self._buf[entry[2]:entry[2] + entry[3]])
+
+    def find(self, key: str) -> Optional[int]:
+        """按键查找文档序号"""
+        target = key.encode("utf-8")
+        doc_no = self._bisect(target)
+        if doc_no < self._count and self._key_bytes(doc_no) == target:
+            return doc_no
+        return None
+
+    def _bisect(self, target: bytes, right: bool = False) -> int:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self._key_bytes(mid)
+            if key < target or (right and key == target):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def page_after(
+        self, after: Optional[str], limit: int, predicate: Optional[Callable[[PromptRecord], bool]] = None
+    ) -> List[Tuple[str, PromptRecord]]:
+        """按键顺序返回after之后满足条件的最多limit条 (键, prompt)"""
+        start = self._bisect(after.encode("utf-8"), right=True) if after is not None else 0
+        page = []
+        for doc_no in range(start, self._count):
+            prompt = self.prompt(doc_no)
+            if predicate is None or predicate(prompt):
+                page.append((self.key(doc_no), prompt))
+                if len(page) >= limit:
+                    break
+        return page
+
+    def postings(self, field: str, gram: str) -> Dict[int, int]:
+        """gram在指定字段的倒排表 {文档序号: 词频}"""
+        table_offset, count = self._gram_tables[field]
+        target = gram.encode("utf-8")
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            gram_offset, gram_length, posting_offset, posting_count = _GRAM.unpack_from(
+                self._buf, table_offset + mid * _GRAM.size
+            )
+            current = self._buf[gram_offset:gram_offset + gram_length]
+            if current == target:
+                return dict(_POSTING.iter_unpack(self._buf[posting_offset:posting_offset + posting_count * _POSTING.size]))
+            if current < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return {}
+
+    def search(
+        self, query: str, search_in: List[str], ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None, offset: int = 0,
+    ) -> SearchPage:
+        """与PromptSearchIndex.search_steps相同的子串搜索（快照中只有启用的prompt）"""
+        scored, prompts = [], {}
+        for _, _, scored, prompts in self._score_chunks(query, search_in, ranking, max(1, self._count)):
+            pass
+        return SearchPage([(score, prompts[doc_no]) for score, doc_no in rank_scored(scored, limit, offset)], len(scored))
+
+    def search_chunks(
+        self, query: str, search_in: List[str], ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None, chunk_size: int = 500,
+    ) -> Iterator[SearchProgress]:
+        """分块搜索，每块结束产出一次目前的top-k"""
+        for done, total, scored, prompts in self._score_chunks(query, search_in, ranking, chunk_size):
+            page = SearchPage([(score, prompts[doc_no]) for score, doc_no in rank_scored(scored, limit)], len(scored))
+            yield SearchProgress(done, total, page)
+
+    def _score_chunks(
+        self, query: str, search_in: List[str], ranking: str, chunk_size: int
+    ) -> Iterator[Tuple[int, int, List[Tuple[float, int]], Dict[int, PromptRecord]]]:
+        query_cleaned = query.strip().lower()
+        if not query_cleaned:
+            yield 0, 0, [], {}
+            return
+
+        grams = query_grams(query_cleaned)
+        # 倒排表按字段读取一次，既用于求候选集也用于BM25
+        field_postings = {
+            field: [self.postings(field, gram) for gram in grams] for field in FIELDS if field in search_in
+        }
+        candidates = {}
+        for field, lists in field_postings.items():
+            if all(lists):
+                smallest = min(lists, key=len)
+                candidates[field] = set(smallest).intersection(*(keys.keys() for keys in lists if keys is not smallest))
+            else:
+                candidates[field] = set()
+        doc_nos = sorted(set().union(*candidates.values()))
+        chunks = [doc_nos[i:i + chunk_size] for i in range(0, len(doc_nos), chunk_size)] or [[]]
+
+        scored: List[Tuple[float, int]] = []
+        prompts: Dict[int, PromptRecord] = {}
+        for done, chunk in enumerate(chunks, 1):
+            for doc_no in chunk:
+                prompt = self.prompt(doc_no)
+                # 按 标题 > 标签 > 内容 取第一个真正命中的字段
+                fields = [(field, score) for field, score in FIELD_SCORES if doc_no in candidates.get(field, ())]
+                field_score = match_score(prompt, fields, query_cleaned)
+                if field_score is None:
+                    continue
+                prompts[doc_no] = prompt
+                if ranking == RANKING_BM25:
+                    scored.append((self._bm25_score(doc_no, field_postings), doc_no))
+                else:
+                    scored.append((float(field_score), doc_no))
+            yield done, len(chunks), scored, prompts
+
+    def _bm25_score(self, doc_no: int, field_postings: Dict[str, List[Dict[int, int]]]) -> float:
+        entry = self._entry(doc_no)
+        score = 0.0
+        for field, lists in field_postings.items():
+            avg_length = self._field_length_totals[field] / self._count
+            field_length = entry[4 + FIELDS.index(field)]
+            field_score = 0.0
+            for keys in lists:
+                tf = keys.get(doc_no)
+                if tf:
+                    field_score += bm25_idf(len(keys), self._count) * bm25_tf(tf, field_length, avg_length)
+            score += BM25_FIELD_WEIGHTS[field] * field_score
+        return score
+
+
+class SnapshotReader:
+    """跟踪快照文件：文件被替换且代数更大时重新映射，并把前后差异作为变更事件通知订阅者"""
+
+    def __init__(self, path: Path, check_interval: float = settings.CATALOG_SNAPSHOT_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.swaps = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked = float("-inf")
+        self._listeners: List[ChangeListener] = []
+
+    def subscribe(self, listener: ChangeListener) -> None:
+        self._listeners.append(listener)
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """当前快照；距上次检查超过check_interval时先检查文件是否被替换"""
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self.refresh()
+        return self._snapshot
+
+    def refresh(self) -> bool:
+        """检查快照文件，换用了新快照时返回True"""
+        self._checked = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        old = self._snapshot
+        if old is not None and old.signature == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            return False
+        try:
+            snapshot = CatalogSnapshot(self.path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Error loading catalog snapshot {self.path}: {e}")
+            return False
+        if old is not None and snapshot.generation <= old.generation:
+            return False
+        self._snapshot = snapshot
+        self.swaps += 1
+        if old is not None and self._listeners:
+            self._notify_diff(old, snapshot)
+        return True
+
+    def _notify_diff(self, old: CatalogSnapshot, new: CatalogSnapshot) -> None:
+        old_checksums = {old.key(doc_no): old.checksum(doc_no) for doc_no in range(len(old))}
+        for doc_no in range(len(new)):
+            key = new.key(doc_no)
+            checksum = old_checksums.pop(key, None)
+            if checksum == new.checksum(doc_no):
+                continue
+            change_type = ChangeType.CREATED if checksum is None else ChangeType.MODIFIED
+            self._emit(PromptChange(change_type, key), new.prompt(doc_no))
+        # 被删除或被禁用的prompt都从快照中消失
+        for key in old_checksums:
+            self._emit(PromptChange(ChangeType.DELETED, key), None)
+
+    def _emit(self, change: PromptChange, prompt: Optional[PromptRecord]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(change, prompt)
+            except Exception as e:
+                print(f"Error in catalog snapshot listener for '{change.title_stem}': {e}")
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "path": str(self.path),
+            "generation": snapshot.generation if snapshot else None,
+            "prompts": len(snapshot) if snapshot else 0,
+            "swaps": self.swaps,
+        }
+
+
+class SnapshotPromptService:
+    """只读存储适配器：启用的prompt从共享快照读取，快照尚未生成时回退到底层存储服务。
+
+    目录版本号使用快照代数，写入方进程重启后仍单调递增。
+    """
+
+    def __init__(self, reader: SnapshotReader, storage_service):
+        self.reader = reader
+        self.storage_service = storage_service
+
+    async def get_catalog_version(self) -> Optional[int]:
+        snapshot = self.reader.current()
+        return snapshot.generation if snapshot else None
+
+    def subscribe_changes(self, listener: ChangeListener) -> None:
+        self.reader.subscribe(listener)
+
+    async def get_updated_titles(self, since):
+        return await self.storage_service.get_updated_titles(since)
+
+    async def get_latest_updated_at(self):
+        return await self.storage_service.get_latest_updated_at()
+
+    async def read_prompt(self, title: str) -> Optional[PromptRecord]:
+        snapshot = self.reader.current()
+        if snapshot is None:
+            return await self.storage_service.read_prompt(title)
+        doc_no = snapshot.find(title)
+        return snapshot.prompt(doc_no) if doc_no is not None else None
+
+    async def read_prompts(self, titles: List[str]) -> Dict[str, PromptRecord]:
+        snapshot = self.reader.current()
+        if snapshot is None:
+            return await self.storage_service.read_prompts(titles)
+        found = {}
+        for title in dict.fromkeys(titles):
+            doc_no = snapshot.find(title)
+            if doc_no is not None:
+                found[title] = snapshot.prompt(doc_no)
+        return found
+
+    async def list_prompts_page(
+        self, after: Optional[str], limit: int, enabled_only: bool = False,
+        tags: Optional[List[str]] = None, include_content: bool = True,
+    ) -> List[Tuple[str, PromptRecord]]:
+        snapshot = self.reader.current()
+        if snapshot is None or not enabled_only:
+            return await self.storage_service.list_prompts_page(
+                after, limit, enabled_only=enabled_only, tags=tags, include_content=include_content
+            )
+        # 快照记录整条解码并缓存，include_content不影响读取开销
+
+        def matches(prompt: PromptRecord) -> bool:
+            return not tags or any(tag in prompt.tags for tag in tags)
+
+        return snapshot.page_after(after, limit, matches)
+
+    async def search_prompts_page(
+        self, query: str, search_in: List[str], ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None, offset: int = 0, enabled_only: bool = False,
+    ) -> SearchPage:
+        snapshot = self.reader.current()
+        if snapshot is None or not enabled_only:
+            return await self.storage_service.search_prompts_page(
+                query, search_in, ranking, limit=limit, offset=offset, enabled_only=enabled_only
+            )
+        return snapshot.search(query, search_in, ranking, limit=limit, offset=offset)
+
+    async def search_prompts_chunks(
+        self, query: str, search_in: List[str], ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None, enabled_only: bool = False, chunk_size: int = settings.SEARCH_CHUNK_SIZE,
+    ) -> AsyncIterator[SearchProgress]:
+        snapshot = self.reader.current()
+        if snapshot is None or not enabled_only:
+            async for progress in self.storage_service.search_prompts_chunks(
+                query, search_in, ranking, limit=limit, enabled_only=enabled_only, chunk_size=chunk_size
+            ):
+                yield progress
+            return
+        for progress in snapshot.search_chunks(query, search_in, ranking, limit=limit, chunk_size=chunk_size):
+            yield progress
+            await asyncio.sleep(0)
+
+
+class CatalogSnapshotPublisher:
+    """持有锁文件的进程负责在目录变化后重写快照，其他进程定期检查并换用新快照。
+
+    写入方退出后锁随之释放，其余进程在下一次检查时接管写入。
+    """
+
+    def __init__(
+        self, storage_service, reader: SnapshotReader,
+        interval: float = settings.CATALOG_SNAPSHOT_REFRESH_INTERVAL,
+    ):
+        self.storage_service = storage_service
+        self.reader = reader
+        self.interval = interval
+        self.is_writer = False
+        self.published = 0
+        self._published_version: Optional[int] = None
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self._check()
+        self._task = asyncio.create_task(self._run(), name="catalog-snapshot")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()  # 关闭文件即释放flock
+            self._lock_file = None
+            self.is_writer = False
+
+    async def publish(self) -> int:
+        """把存储中启用的prompt写成新快照，返回快照代数"""
+        version = await self.storage_service.get_catalog_version()
+        entries: List[Tuple[str, PromptRecord]] = []
+        after = None
+        while True:
+            page = await self.storage_service.list_prompts_page(after, 1000, enabled_only=True)
+            entries.extend(page)
+            if len(page) < 1000:
+                break
+            after = page[-1][0]
+        # 编码与写盘在线程中进行，不阻塞事件循环
+        generation = await asyncio.to_thread(write_snapshot, self.reader.path, entries, version)
+        self._published_version = version
+        self.published += 1
+        self.reader.refresh()
+        print(f"Published catalog snapshot generation {generation} ({len(entries)} prompts)")
+        return generation
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._check()
+            except Exception as e:
+                print(f"Error refreshing catalog snapshot: {e}")
+
+    async def _check(self) -> None:
+        if not self.is_writer and self._acquire_lock():
+            self.is_writer = True
+            if not settings.USE_DATABASE:
+                # 只有写入方需要维护目录，由监听器保持其为最新
+                from backend.services.prompt_catalog import get_prompt_catalog
+                from backend.services.prompt_watcher import start_prompt_watcher
+
+                start_prompt_watcher(get_prompt_catalog(settings.PROMPT_TEMPLATE_DIR))
+            await self.publish()
+            return
+        if self.is_writer:
+            version = await self.storage_service.get_catalog_version()
+            if version != self._published_version:
+                await self.publish()
+        else:
+            self.reader.refresh()
+
+    def _acquire_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        lock_file = open(self.reader.path.with_name(self.reader.path.name + ".lock"), "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def stats(self) -> dict:
+        return {"writer": self.is_writer, "published": self.published, **self.reader.stats()}
+
+
+_reader: Optional[SnapshotReader] = None
+
+
+def get_snapshot_reader() -> Optional[SnapshotReader]:
+    """CATALOG_SNAPSHOT_PATH已配置时返回进程级快照读取器"""
+    global _reader
+    if not settings.CATALOG_SNAPSHOT_PATH:
+        return None
+    if _reader is None:
+        _reader = SnapshotReader(Path(settings.CATALOG_SNAPSHOT_PATH))
+    return _reader
@@ -1,16 +1,65 @@
 """
 数据库服务层 - 替代文件服务
 """
+import heapq
+from collections import Counter
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from sqlalchemy import and_, or_, select, func, delete
+from sqlalchemy import Float, and_, case, cast, delete, func, insert, literal, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from backend.config import settings
 from backend.database import get_async_session, async_engine
-from backend.db_models import User as DBUser, Tag as DBTag, Prompt as DBPrompt, PromptTag
-from backend.models import Prompt, PromptCreate, PromptUpdate, UserCreate, UserInDB, User
+from backend.db_models import User as DBUser, Tag as DBTag, Prompt as DBPrompt, PromptTag, CatalogState
+from backend.db_models import SearchFieldStats, SearchTermStats
+from backend.models import PromptCreate, PromptRecord, PromptUpdate, UserCreate, UserInDB, User
+from backend.services.prompt_catalog import ChangeListener, ChangeType, PromptChange
+from backend.services.prompt_query import PromptFilter, PromptListPage, build_page, decode_cursor
+from backend.services.search_index import text_grams
+from backend.services.search_scoring import (BM25_B, BM25_FIELD_WEIGHTS, BM25_K1,
+                                             FIELD_SCORES, RANKING_BM25,
+                                             RANKING_PRIORITY, SearchPage,
+                                             SearchProgress, bm25_idf, bm25_tf,
+                                             query_grams)
+
+
+# 本进程内提示词写入的监听器（DatabaseService按需创建，监听器在模块级共享）
+_change_listeners: List[ChangeListener] = []
+
+# 元数据投影查询的列（不含content）
+_METADATA_COLUMNS = (
+    DBPrompt.id,
+    DBPrompt.title,
+    DBPrompt.description,
+    DBPrompt.status,
+    DBPrompt.creator_username,
+    DBPrompt.usage_count,
+    DBPrompt.created_at,
+    DBPrompt.updated_at,
+)
+# 元数据查询按id批量取标签时每批的id数
+_TAG_QUERY_BATCH = 1000
+
+# 维护BM25统计的文本字段（标签的文档频率按整个查询串在标签表上统计）
+_STATS_FIELDS = ("title", "content")
+# 按IN列表批量更新n-gram统计时每条语句的gram数
+_STATS_BATCH = 1000
+# 统计表缺失的警告只打印一次
+_search_stats_warned = False
+
+
+def _stats_texts(title: str, content: str) -> Dict[str, str]:
+    """参与BM25统计的各字段文本（已小写）"""
+    return {"title": title.lower(), "content": content.lower()}
+
+
+def _upsert(session: AsyncSession, table):
+    """按方言选择支持 ON CONFLICT 的insert"""
+    dialect = sqlite if session.bind.dialect.name == "sqlite" else postgresql
+    return dialect.insert(table)
 
 
 class DatabaseService:
@@ -130,19 +179,126 @@ class DatabaseService:
 
     # ==================== 提示词相关操作 ====================
 
-    async def list_prompts(self) -> List[Prompt]:
-        """列出所有提示词"""
+    async def list_prompts(self, include_content: bool = True) -> List[PromptRecord]:
+        """列出所有提示词；include_content为False时只查询元数据列"""
         async with AsyncSession(bind=async_engine) as session:
-            result = await session.execute(
-                select(DBPrompt)
-                .options(selectinload(DBPrompt.tags))
-                .order_by(DBPrompt.updated_at.desc())
+            stmt = self._prompt_select(include_content).order_by(DBPrompt.updated_at.desc())
+            return await self._fetch_records(session, stmt, include_content)
+
+    async def list_prompts_page(
+        self,
+        after: Optional[str],
+        limit: int,
+        enabled_only: bool = False,
+        tags: Optional[List[str]] = None,
+        include_content: bool = True,
+    ) -> List[Tuple[str, PromptRecord]]:
+        """按标题顺序分页（键集分页：title > after），返回最多limit条 (标题, prompt)"""
+        async with AsyncSession(bind=async_engine) as session:
+            stmt = self._prompt_select(include_content).order_by(DBPrompt.title).limit(limit)
+            if after is not None:
+                stmt = stmt.where(DBPrompt.title > after)
+            if enabled_only:
+                stmt = stmt.where(DBPrompt.status == "enabled")
+            if tags:
+                stmt = stmt.where(DBPrompt.tags.any(DBTag.name.in_(tags)))
+            records = await self._fetch_records(session, stmt, include_content)
+            return [(record.title, record) for record in records]
+
+    async def query_prompts(
+        self,
+        filters: PromptFilter,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        include_content: bool = True,
+    ) -> PromptListPage:
+        """按 (updated_at 降序, title 升序) 键集分页列出提示词，过滤条件在SQL中完成。
+
+        总数只在第一页统计一次，随游标传递到后续页（近似值）。
+        """
+        after = decode_cursor(cursor) if cursor else None
+        conditions = self._filter_conditions(filters)
+        async with AsyncSession(bind=async_engine) as session:
+            stmt = (
+                self._prompt_select(include_content)
+                .where(*conditions)
+                .order_by(DBPrompt.updated_at.desc(), DBPrompt.title)
             )
-            db_prompts = result.scalars().all()
-            
-            return [self._db_prompt_to_model(db_prompt) for db_prompt in db_prompts]
+            if after is not None:
+                stmt = stmt.where(
+                    or_(
+                        DBPrompt.updated_at < after.updated_at,
+                        and_(DBPrompt.updated_at == after.updated_at, DBPrompt.title > after.key),
+                    )
+                )
+            if limit is not None:
+                stmt = stmt.limit(limit + 1)
+            records = await self._fetch_records(session, stmt, include_content)
+
+            total = after.total if after is not None else None
+            if total is None:
+                if after is None and (limit is None or len(records) <= limit):
+                    total = len(records)
+                else:
+                    total = await session.scalar(select(func.count(DBPrompt.id)).where(*conditions))
+        return build_page([(record.title, record) for record in records], limit, total)
+
+    def _filter_conditions(self, filters: PromptFilter) -> List[Any]:
+        conditions = []
+        if filters.status is not None:
+            conditions.append(DBPrompt.status == filters.status)
+        if filters.tag is not None:
+            conditions.append(DBPrompt.tags.any(DBTag.name == filters.tag))
+        if filters.creator_username is not None:
+            conditions.append(DBPrompt.creator_username == filters.creator_username)
+        query_lower = (filters.q or "").strip().lower()
+        if query_lower:
+            matchers = self._match_clauses(query_lower, [field for field, _ in FIELD_SCORES])
+            conditions.append(or_(*matchers.values()))
+        return conditions
+
+    def _prompt_select(self, include_content: bool):
+        """完整查询加载ORM对象及其标签；元数据查询只选取所需列，不含content"""
+        if include_content:
+            return select(DBPrompt).options(selectinload(DBPrompt.tags))
+        return select(*_METADATA_COLUMNS)
+
+    async def _fetch_records(self, session: AsyncSession, stmt, include_content: bool) -> List[PromptRecord]:
+        result = await session.execute(stmt)
+        if include_content:
+            return [self._db_prompt_to_model(db_prompt) for db_prompt in result.scalars()]
+
+        rows = result.all()
+        # 标签用一条关联查询取回，不实例化ORM对象
+        tags_by_id: Dict[int, List[str]] = {row.id: [] for row in rows}
+        ids = list(tags_by_id)
+        # 分批查询，避免全表列表时绑定参数超过驱动上限（asyncpg为32767）
+        for start in range(0, len(ids), _TAG_QUERY_BATCH):
+            tag_rows = await session.execute(
+                select(PromptTag.prompt_id, DBTag.name)
+                .join(DBTag, DBTag.id == PromptTag.tag_id)
+                .where(PromptTag.prompt_id.in_(ids[start:start + _TAG_QUERY_BATCH]))
+                .order_by(PromptTag.id)
+            )
+            for prompt_id, name in tag_rows:
+                tags_by_id[prompt_id].append(name)
+        return [
+            PromptRecord(
+                title=row.title,
+                content=None,
+                tags=tags_by_id[row.id],
+                remark=row.description or "",
+                status=row.status,
+                creator_username=row.creator_username,
+                usage_count=row.usage_count,
+                created_at=row.created_at,
+                updated_at=row.updated_at,
+                file_path="",
+            )
+            for row in rows
+        ]
 
-    async def read_prompt(self, title: str) -> Optional[Prompt]:
+    async def read_prompt(self, title: str) -> Optional[PromptRecord]:
         """根据标题读取提示词"""
         async with AsyncSession(bind=async_engine) as session:
             result = await session.execute(
@@ -156,7 +312,19 @@ class DatabaseService:
                 return self._db_prompt_to_model(db_prompt)
             return None
 
-    async def save_prompt(self, prompt_data: Dict[str, Any]) -> Prompt:
+    async def read_prompts(self, titles: List[str]) -> Dict[str, PromptRecord]:
+        """批量读取提示词（单条 WHERE title IN 查询），返回 {标题: prompt}"""
+        if not titles:
+            return {}
+        async with AsyncSession(bind=async_engine) as session:
+            result = await session.execute(
+                select(DBPrompt)
+                .options(selectinload(DBPrompt.tags))
+                .where(DBPrompt.title.in_(set(titles)))
+            )
+            return {db_prompt.title: self._db_prompt_to_model(db_prompt) for db_prompt in result.scalars()}
+
+    async def save_prompt(self, prompt_data: Dict[str, Any]) -> PromptRecord:
         """保存新的提示词"""
         async with AsyncSession(bind=async_engine) as session:
             # 检查标题是否已存在
@@ -186,6 +354,8 @@ class DatabaseService:
                         db_tag = await self.get_or_create_tag(tag_name.strip(), session)
                         db_prompt.tags.append(db_tag)
 
+            await self._bump_catalog_version(session)
+            await self._apply_search_stats(session, None, _stats_texts(db_prompt.title, db_prompt.content))
             await session.commit()
             await session.refresh(db_prompt)
             
@@ -197,9 +367,11 @@ class DatabaseService:
             )
             db_prompt = result.scalar_one()
             
-            return self._db_prompt_to_model(db_prompt)
+            prompt = self._db_prompt_to_model(db_prompt)
+            self._notify_change(PromptChange(ChangeType.CREATED, prompt.title), prompt)
+            return prompt
 
-    async def update_prompt(self, title: str, update_data: Dict[str, Any]) -> Optional[Prompt]:
+    async def update_prompt(self, title: str, update_data: Dict[str, Any]) -> Optional[PromptRecord]:
         """更新提示词"""
         async with AsyncSession(bind=async_engine) as session:
             # 获取现有提示词
@@ -222,6 +394,8 @@ class DatabaseService:
                 if existing.scalar_one_or_none():
                     raise ValueError(f"标题 '{new_title}' 已存在")
 
+            old_texts = _stats_texts(db_prompt.title, db_prompt.content)
+
             # 更新字段
             db_prompt.updated_at = datetime.now(timezone.utc)
 
@@ -248,6 +422,8 @@ class DatabaseService:
                             db_tag = await self.get_or_create_tag(tag_name.strip(), session)
                             db_prompt.tags.append(db_tag)
 
+            await self._bump_catalog_version(session)
+            await self._apply_search_stats(session, old_texts, _stats_texts(db_prompt.title, db_prompt.content))
             await session.commit()
             await session.refresh(db_prompt)
             
@@ -259,7 +435,13 @@ class DatabaseService:
             )
             db_prompt = result.scalar_one()
             
-            return self._db_prompt_to_model(db_prompt)
+            prompt = self._db_prompt_to_model(db_prompt)
+            if prompt.title != title:
+                change = PromptChange(ChangeType.RENAMED, prompt.title, title)
+            else:
+                change = PromptChange(ChangeType.MODIFIED, prompt.title)
+            self._notify_change(change, prompt)
+            return prompt
 
     async def delete_prompt(self, title: str) -> bool:
         """删除提示词"""
@@ -272,74 +454,238 @@ class DatabaseService:
             if not db_prompt:
                 return False
 
+            old_texts = _stats_texts(db_prompt.title, db_prompt.content)
             await session.delete(db_prompt)
+            await self._bump_catalog_version(session)
+            await self._apply_search_stats(session, old_texts, None)
             await session.commit()
+            self._notify_change(PromptChange(ChangeType.DELETED, title), None)
             return True
 
-    async def search_prompts(self, query: str, search_in: List[str]) -> List[Prompt]:
-        """搜索提示词"""
-        if not query.strip():
-            return []
-
+    async def increment_usage(self, title: str, delta: int = 1) -> Optional[int]:
+        """原子地增加使用次数（单条 UPDATE ... RETURNING），返回新计数；提示词不存在时返回None"""
         async with AsyncSession(bind=async_engine) as session:
-            query_lower = query.strip().lower()
-            conditions = []
-
-            # 构建搜索条件
-            if "title" in search_in:
-                conditions.append(func.lower(DBPrompt.title).contains(query_lower))
-            if "content" in search_in:
-                conditions.append(func.lower(DBPrompt.content).contains(query_lower))
-            if "tags" in search_in:
-                # 通过标签搜索
-                tag_subquery = (
-                    select(PromptTag.prompt_id)
-                    .join(DBTag)
-                    .where(func.lower(DBTag.name).contains(query_lower))
+            result = await session.execute(
+                update(DBPrompt)
+                .where(DBPrompt.title == title)
+                # 显式保留updated_at，否则模型的onupdate会把使用统计当作内容更新
+                .values(
+                    usage_count=func.coalesce(DBPrompt.usage_count, 0) + delta,
+                    updated_at=DBPrompt.updated_at,
                 )
-                conditions.append(DBPrompt.id.in_(tag_subquery))
+                .returning(DBPrompt.usage_count)
+                .execution_options(synchronize_session=False)
+            )
+            new_count = result.scalar_one_or_none()
+            await session.commit()
+            return new_count
 
-            if not conditions:
-                return []
+    async def increment_usage_bulk(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        """按 {标题: 增量} 批量增加使用次数，一条UPDATE语句完成；返回更新后的计数
 
-            # 执行搜索
+        使用次数不属于目录内容，因此不递增目录版本号，也不改变updated_at。
+        """
+        if not deltas:
+            return {}
+        async with AsyncSession(bind=async_engine) as session:
             result = await session.execute(
-                select(DBPrompt)
+                update(DBPrompt)
+                .where(DBPrompt.title.in_(list(deltas)))
+                .values(
+                    usage_count=func.coalesce(DBPrompt.usage_count, 0)
+                    + case(deltas, value=DBPrompt.title, else_=0),
+                    updated_at=DBPrompt.updated_at,
+                )
+                .returning(DBPrompt.title, DBPrompt.usage_count)
+                .execution_options(synchronize_session=False)
+            )
+            counts = {row.title: row.usage_count for row in result}
+            await session.commit()
+            return counts
+
+    async def search_prompts(
+        self, query: str, search_in: List[str], ranking: str = RANKING_PRIORITY
+    ) -> List[PromptRecord]:
+        """搜索提示词"""
+        page = await self.search_prompts_page(query, search_in, ranking)
+        return [prompt for _, prompt in page.hits]
+
+    async def search_prompts_page(
+        self,
+        query: str,
+        search_in: List[str],
+        ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        enabled_only: bool = False,
+    ) -> SearchPage:
+        """搜索提示词，打分、排序、分页和状态过滤都在SQL中完成"""
+        if not query.strip():
+            return SearchPage([], 0)
+
+        async with AsyncSession(bind=async_engine) as session:
+            clauses = await self._search_clauses(session, query.strip().lower(), search_in, ranking, enabled_only)
+            if clauses is None:
+                return SearchPage([], 0)
+            where, score, order_by = clauses
+
+            # 总数用窗口函数在同一条语句中取得，避免额外的COUNT往返
+            stmt = (
+                select(DBPrompt, score.label("score"), func.count().over().label("total"))
                 .options(selectinload(DBPrompt.tags))
-                .where(or_(*conditions))
-                .order_by(DBPrompt.updated_at.desc())
+                .where(where)
+                .order_by(*order_by)
+                .offset(offset)
             )
-            db_prompts = result.scalars().all()
+            if limit is not None:
+                stmt = stmt.limit(limit)
+            rows = (await session.execute(stmt)).all()
+
+            if rows:
+                total = rows[0].total
+            elif offset:
+                total = (await session.execute(select(func.count(DBPrompt.id)).where(where))).scalar() or 0
+            else:
+                total = 0
+
+            hits = [(float(row.score or 0), self._db_prompt_to_model(row[0])) for row in rows]
+            return SearchPage(hits, total)
+
+    async def search_prompts_chunks(
+        self,
+        query: str,
+        search_in: List[str],
+        ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None,
+        enabled_only: bool = False,
+        chunk_size: int = settings.SEARCH_CHUNK_SIZE,
+    ) -> AsyncIterator[SearchProgress]:
+        """按id区间分片搜索，每个分片查询完成后产出一次合并后的top-k"""
+        empty = SearchProgress(0, 0, SearchPage([], 0))
+        if not query.strip():
+            yield empty
+            return
 
-            # 计算匹配分数并排序
-            scored_prompts = []
-            for db_prompt in db_prompts:
-                score = self._calculate_search_score(db_prompt, query_lower, search_in)
-                scored_prompts.append((score, db_prompt))
+        async with AsyncSession(bind=async_engine) as session:
+            clauses = await self._search_clauses(session, query.strip().lower(), search_in, ranking, enabled_only)
+            id_range = (await session.execute(select(func.min(DBPrompt.id), func.max(DBPrompt.id)))).one()
+            if clauses is None or id_range[0] is None:
+                yield empty
+                return
+            where, score, order_by = clauses
+            low, high = id_range
+
+            # 与SQL中的排序保持一致，用于在Python中合并各分片的top-k
+            if ranking == RANKING_BM25:
+                def sort_key(hit):
+                    return (-hit[0], hit[1].title)
+            else:
+                def sort_key(hit):
+                    return (-hit[0], -hit[1].updated_at.timestamp(), hit[1].title)
+
+            starts = list(range(low - 1, high, chunk_size))
+            hits: List[Tuple[float, PromptRecord]] = []
+            total = 0
+            for done, start in enumerate(starts, 1):
+                stmt = (
+                    select(DBPrompt, score.label("score"), func.count().over().label("total"))
+                    .options(selectinload(DBPrompt.tags))
+                    .where(where, DBPrompt.id > start, DBPrompt.id <= start + chunk_size)
+                    .order_by(*order_by)
+                )
+                if limit is not None:
+                    stmt = stmt.limit(limit)
+                rows = (await session.execute(stmt)).all()
+                if rows:
+                    total += rows[0].total
+                    hits.extend((float(row.score or 0), self._db_prompt_to_model(row[0])) for row in rows)
+                    hits = heapq.nsmallest(limit, hits, key=sort_key) if limit is not None else sorted(hits, key=sort_key)
+                yield SearchProgress(done, len(starts), SearchPage(list(hits), total))
+
+    async def _search_clauses(
+        self, session: AsyncSession, query_lower: str, search_in: List[str], ranking: str, enabled_only: bool
+    ):
+        """构建搜索的 (过滤条件, 得分表达式, 排序)；没有可搜索字段时返回None"""
+        matchers = self._match_clauses(query_lower, search_in)
+
+        if not matchers:
+            return None
 
-            # 按分数排序
-            scored_prompts.sort(key=lambda x: x[0], reverse=True)
-            
-            return [self._db_prompt_to_model(db_prompt) for _, db_prompt in scored_prompts]
+        where = or_(*matchers.values())
+        if enabled_only:
+            where = and_(where, DBPrompt.status == "enabled")
+
+        if ranking == RANKING_BM25:
+            score = await self._bm25_score_expression(session, query_lower, search_in, matchers.get("tags"))
+            order_by = (score.desc(), DBPrompt.title)
+        else:
+            # 标题 > 标签 > 内容 分档打分
+            score = case(
+                *[(matchers[field], field_score) for field, field_score in FIELD_SCORES if field in matchers],
+                else_=0,
+            )
+            order_by = (score.desc(), DBPrompt.updated_at.desc(), DBPrompt.title)
+        return where, score, order_by
+
+    def _match_clauses(self, query_lower: str, search_in: List[str]) -> Dict[str, Any]:
+        """各字段的子串匹配条件 {字段: 条件}"""
+        matchers = {}
+        if "title" in search_in:
+            matchers["title"] = func.lower(DBPrompt.title).contains(query_lower)
+        if "tags" in search_in:
+            # 通过标签搜索
+            tag_subquery = (
+                select(PromptTag.prompt_id)
+                .join(DBTag)
+                .where(func.lower(DBTag.name).contains(query_lower))
+            )
+            matchers["tags"] = DBPrompt.id.in_(tag_subquery)
+        if "content" in search_in:
+            matchers["content"] = func.lower(DBPrompt.content).contains(query_lower)
+        return matchers
+
+    async def _bm25_score_expression(
+        self, session: AsyncSession, query_lower: str, search_in: List[str], tag_match=None
+    ):
+        """构建字段加权BM25得分的SQL表达式。
+
+        文档数、字段平均长度和各n-gram的文档频率按键从增量维护的统计表读取；词频用
+        (length(col) - length(replace(col, gram, ''))) / len(gram) 在SQL中计算，只对命中的行求值。
+        标签字段按"命中即一次出现"计入，其文档频率在标签表上统计。
+        """
+        grams = query_grams(query_lower)
+        text_fields = [
+            (field, func.lower(column))
+            for field, column in (("title", DBPrompt.title), ("content", DBPrompt.content))
+            if field in search_in
+        ]
+
+        doc_count, avg_lengths, dfs = await self._load_search_stats(
+            session, [field for field, _ in text_fields], grams
+        )
 
-    def _calculate_search_score(self, db_prompt: DBPrompt, query_lower: str, search_in: List[str]) -> int:
-        """计算搜索匹配分数"""
-        score = 0
-        
-        if "title" in search_in and query_lower in db_prompt.title.lower():
-            score = 100
-        elif "tags" in search_in:
-            for tag in db_prompt.tags:
-                if query_lower in tag.name.lower():
-                    score = max(score, 50)
-        elif "content" in search_in and query_lower in db_prompt.content.lower():
-            score = max(score, 10)
-            
+        score = literal(0.0, Float)
+        for field, column in text_fields:
+            avg_length = avg_lengths.get(field) or 1.0
+            field_length = cast(func.length(column), Float)
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * field_length / avg_length)
+            for gram in grams:
+                idf = bm25_idf(dfs.get((field, gram), 0), doc_count)
+                tf = cast(func.length(column) - func.length(func.replace(column, gram, "")), Float) / len(gram)
+                score = score + BM25_FIELD_WEIGHTS[field] * idf * (tf * (BM25_K1 + 1.0)) / (tf + norm)
+        if tag_match is not None:
+            tag_df = await session.scalar(
+                select(func.count(func.distinct(PromptTag.prompt_id)))
+                .join(DBTag)
+                .where(func.lower(DBTag.name).contains(query_lower))
+            )
+            tag_weight = BM25_FIELD_WEIGHTS["tags"] * bm25_idf(tag_df or 0, doc_count) * bm25_tf(1, 1, 1)
+            score = score + case((tag_match, tag_weight), else_=0.0)
         return score
 
-    def _db_prompt_to_model(self, db_prompt: DBPrompt) -> Prompt:
-        """将数据库模型转换为Pydantic模型"""
-        return Prompt(
+    def _db_prompt_to_model(self, db_prompt: DBPrompt) -> PromptRecord:
+        """将数据库模型转换为内部记录（API响应时再转换为Pydantic模型）"""
+        return PromptRecord(
             title=db_prompt.title,
             content=db_prompt.content,
             tags=[tag.name for tag in db_prompt.tags],
@@ -352,6 +698,186 @@ class DatabaseService:
             file_path=""  # 数据库模式下不需要文件路径
         )
 
+    # ==================== 目录版本 ====================
+
+    async def get_catalog_version(self) -> Optional[int]:
+        """获取提示词目录版本号（单调递增），表不可用时返回None"""
+        try:
+            async with AsyncSession(bind=async_engine) as session:
+                result = await session.execute(
+                    select(CatalogState.version).where(CatalogState.id == 1)
+                )
+                return result.scalar_one_or_none() or 0
+        except Exception as e:
+            print(f"Error reading catalog version: {e}")
+            return None
+
+    async def _bump_catalog_version(self, session: AsyncSession) -> None:
+        """在当前事务中递增目录版本号"""
+        result = await session.execute(
+            update(CatalogState).where(CatalogState.id == 1).values(version=CatalogState.version + 1)
+        )
+        if result.rowcount == 0:
+            await session.execute(insert(CatalogState).values(id=1, version=1))
+
+    # ==================== BM25统计 ====================
+
+    async def _load_search_stats(
+        self, session: AsyncSession, fields: List[str], grams: List[str]
+    ) -> Tuple[int, Dict[str, float], Dict[Tuple[str, str], int]]:
+        """读取BM25统计：(文档数, {字段: 平均长度}, {(字段, gram): 文档频率})。
+
+        统计表由 scripts/init_database.py 或迁移脚本建立，之后随写入增量维护；
+        尚未建立时本次查询退回全表聚合（搜索只读，不在查询中建表）。
+        """
+        field_rows = (await session.execute(select(SearchFieldStats))).scalars().all()
+        if len(field_rows) < len(_STATS_FIELDS):
+            return await self._aggregate_search_stats(session, fields, grams)
+
+        doc_count = max(row.doc_count for row in field_rows)
+        avg_lengths = {row.field: row.length_total / row.doc_count if row.doc_count else 0.0 for row in field_rows}
+        dfs = {}
+        if fields:
+            rows = await session.execute(
+                select(SearchTermStats.field, SearchTermStats.gram, SearchTermStats.df).where(
+                    SearchTermStats.field.in_(fields),
+                    SearchTermStats.gram.in_(grams),
+                )
+            )
+            dfs = {(field, gram): df for field, gram, df in rows}
+        return doc_count, avg_lengths, dfs
+
+    async def _aggregate_search_stats(
+        self, session: AsyncSession, fields: List[str], grams: List[str]
+    ) -> Tuple[int, Dict[str, float], Dict[Tuple[str, str], int]]:
+        """统计表尚未建立时用一次全表聚合得到同样的统计（每次查询都扫描全表）"""
+        global _search_stats_warned
+        if not _search_stats_warned:
+            print("Warning: BM25 search stats are missing, run scripts/init_database.py to build them")
+            _search_stats_warned = True
+
+        columns = {"title": func.lower(DBPrompt.title), "content": func.lower(DBPrompt.content)}
+        stats_columns = [func.count(DBPrompt.id)]
+        for field in fields:
+            stats_columns.append(func.avg(func.length(columns[field])))
+            stats_columns.extend(func.count(DBPrompt.id).filter(columns[field].contains(gram)) for gram in grams)
+        stats = list((await session.execute(select(*stats_columns))).one())
+
+        doc_count = stats.pop(0) or 0
+        avg_lengths, dfs = {}, {}
+        for field in fields:
+            avg_lengths[field] = float(stats.pop(0) or 0.0)
+            for gram in grams:
+                dfs[(field, gram)] = stats.pop(0) or 0
+        return doc_count, avg_lengths, dfs
+
+    async def rebuild_search_stats(self, if_missing: bool = False) -> None:
+        """全量重建BM25统计（初始化/迁移脚本调用）；if_missing为True时统计已存在则不做任何事"""
+        async with AsyncSession(bind=async_engine) as session:
+            # 锁住目录版本行但不递增版本：与并发写入（先递增版本）串行，重建期间的写入不会漏计
+            locked = await session.execute(select(CatalogState.id).where(CatalogState.id == 1).with_for_update())
+            if locked.scalar_one_or_none() is None:
+                await session.execute(insert(CatalogState).values(id=1, version=0))
+            if if_missing:
+                existing = await session.scalar(select(func.count()).select_from(SearchFieldStats))
+                if existing >= len(_STATS_FIELDS):
+                    await session.rollback()
+                    return
+
+            doc_count = 0
+            lengths = dict.fromkeys(_STATS_FIELDS, 0)
+            dfs = {field: Counter() for field in _STATS_FIELDS}
+            result = await session.stream(select(DBPrompt.title, DBPrompt.content))
+            async for title, content in result:
+                doc_count += 1
+                for field, text in _stats_texts(title, content).items():
+                    lengths[field] += len(text)
+                    dfs[field].update(text_grams(text).keys())
+
+            await session.execute(delete(SearchTermStats))
+            await session.execute(delete(SearchFieldStats))
+            await session.execute(
+                insert(SearchFieldStats),
+                [{"field": field, "doc_count": doc_count, "length_total": lengths[field]} for field in _STATS_FIELDS],
+            )
+            rows = [{"field": field, "gram": gram, "df": df} for field in _STATS_FIELDS for gram, df in dfs[field].items()]
+            if rows:
+                await session.execute(insert(SearchTermStats), rows)
+            await session.commit()
+            print(f"Rebuilt BM25 search stats for {doc_count} prompts")
+
+    async def _apply_search_stats(
+        self, session: AsyncSession, old: Optional[Dict[str, str]], new: Optional[Dict[str, str]]
+    ) -> None:
+        """在当前事务中按一条提示词的新旧文本增量更新BM25统计。
+
+        须在_bump_catalog_version之后调用：版本行锁使各事务对统计表的修改串行执行。
+        统计尚未建立（字段行不存在）时跳过，由 scripts/init_database.py 重建补全。
+        """
+        if old == new:
+            return
+        doc_delta = (new is not None) - (old is not None)
+        for field in _STATS_FIELDS:
+            old_text = old[field] if old is not None else ""
+            new_text = new[field] if new is not None else ""
+            result = await session.execute(
+                update(SearchFieldStats)
+                .where(SearchFieldStats.field == field)
+                .values(
+                    doc_count=SearchFieldStats.doc_count + doc_delta,
+                    length_total=SearchFieldStats.length_total + (len(new_text) - len(old_text)),
+                )
+            )
+            if result.rowcount == 0:
+                return
+
+            old_grams = text_grams(old_text).keys()
+            new_grams = text_grams(new_text).keys()
+            added = sorted(new_grams - old_grams)
+            if added:
+                stmt = _upsert(session, SearchTermStats)
+                await session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[SearchTermStats.field, SearchTermStats.gram],
+                        set_={"df": SearchTermStats.df + 1},
+                    ),
+                    [{"field": field, "gram": gram, "df": 1} for gram in added],
+                )
+            removed = sorted(old_grams - new_grams)
+            for start in range(0, len(removed), _STATS_BATCH):
+                matched = and_(
+                    SearchTermStats.field == field,
+                    SearchTermStats.gram.in_(removed[start:start + _STATS_BATCH]),
+                )
+                await session.execute(update(SearchTermStats).where(matched).values(df=SearchTermStats.df - 1))
+                await session.execute(delete(SearchTermStats).where(matched, SearchTermStats.df <= 0))
+
+    def subscribe_changes(self, listener: ChangeListener) -> None:
+        """订阅本进程内的提示词写入（其他进程的写入需轮询目录版本号发现）"""
+        if listener not in _change_listeners:
+            _change_listeners.append(listener)
+
+    def _notify_change(self, change: PromptChange, prompt: Optional[PromptRecord]) -> None:
+        for listener in list(_change_listeners):
+            try:
+                listener(change, prompt)
+            except Exception as e:
+                print(f"Error in prompt change listener: {e}")
+
+    async def get_updated_titles(self, since: Optional[datetime]) -> List[Tuple[str, datetime]]:
+        """获取updated_at晚于since的提示词 (标题, 更新时间)，按更新时间升序"""
+        async with AsyncSession(bind=async_engine) as session:
+            stmt = select(DBPrompt.title, DBPrompt.updated_at).order_by(DBPrompt.updated_at)
+            if since is not None:
+                stmt = stmt.where(DBPrompt.updated_at > since)
+            result = await session.execute(stmt)
+            return [(row.title, row.updated_at) for row in result]
+
+    async def get_latest_updated_at(self) -> Optional[datetime]:
+        """最近一次更新时间（updated_at的最大值），没有提示词时返回None"""
+        async with AsyncSession(bind=async_engine) as session:
+            return await session.scalar(select(func.max(DBPrompt.updated_at)))
+
     # ==================== 统计相关操作 ====================
 
     async def get_prompt_count_by_username(self, username: str) -> int:
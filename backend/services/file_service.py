@@ -1,61 +1,93 @@
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import asyncio
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import aiofiles
 import yaml
 
 from backend.config import settings
-from backend.models import Prompt
+from backend.models import PromptRecord
+from backend.services.prompt_catalog import ChangeListener, ChangeType, PromptChange, get_prompt_catalog
+from backend.services.prompt_query import PromptFilter, PromptListPage, build_page, decode_cursor, recency_key
+from backend.services.search_index import get_prompt_search_index
+from backend.services.search_scoring import RANKING_PRIORITY, SearchPage, SearchProgress
 
 
 class FileService:
     def __init__(self):
         self.prompt_dir = settings.PROMPT_TEMPLATE_DIR
+        self.catalog = get_prompt_catalog(self.prompt_dir)
+        self.search_index = get_prompt_search_index(self.catalog)
 
-    async def list_prompts(self) -> List[Prompt]:
-        """列出所有prompt"""
-        prompts = []
-        if not self.prompt_dir.exists(): # Ensure directory exists
-            return []
-        for file_path in self.prompt_dir.glob("*.yaml"):
-            try:
-                prompt = await self.read_prompt(file_path.stem)
-                if prompt:
-                    prompts.append(prompt)
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
-        return prompts
-
-    async def read_prompt(self, title_stem: str) -> Optional[Prompt]: # title_stem is filename without .yaml
+    async def list_prompts(self, include_content: bool = True) -> List[PromptRecord]:
+        """列出所有prompt；include_content为False时返回只含元数据的记录（content在访问时才加载）"""
+        prompts = await self.catalog.scan()
+        if include_content:
+            return prompts
+        return [self._metadata(Path(prompt.file_path).stem, prompt) for prompt in prompts]
+
+    async def read_prompt(self, title_stem: str) -> Optional[PromptRecord]: # title_stem is filename without .yaml
         """读取单个prompt"""
-        file_path = self.prompt_dir / f"{title_stem}.yaml"
-        if not file_path.exists():
-            return None
+        return await self.catalog.get(title_stem)
+
+    async def read_prompts(self, titles: List[str]) -> Dict[str, PromptRecord]:
+        """批量读取prompt，返回 {标题: prompt}（不存在的标题不包含在结果中）"""
+        return await self.catalog.get_many(titles)
+
+    async def list_prompts_page(
+        self,
+        after: Optional[str],
+        limit: int,
+        enabled_only: bool = False,
+        tags: Optional[List[str]] = None,
+        include_content: bool = True,
+    ) -> List[Tuple[str, PromptRecord]]:
+        """按文件名顺序分页（键集分页），返回after之后的最多limit条 (文件名, prompt)"""
+        await self.catalog.scan()
+
+        def matches(prompt: PromptRecord) -> bool:
+            if enabled_only and prompt.status != "enabled":
+                return False
+            return not tags or any(tag in prompt.tags for tag in tags)
+
+        rows = self.catalog.page_after(after, limit, matches)
+        if include_content:
+            return rows
+        return [(stem, self._metadata(stem, prompt)) for stem, prompt in rows]
+
+    async def query_prompts(
+        self,
+        filters: PromptFilter,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        include_content: bool = True,
+    ) -> PromptListPage:
+        """按 (更新时间降序, 文件名) 键集分页列出prompt，过滤与排序都由内存索引完成"""
+        after = decode_cursor(cursor) if cursor else None
+        await self.catalog.scan()
+        rows, total = self.search_index.list_page(
+            filters,
+            recency_key(after.updated_at, after.key) if after else None,
+            limit + 1 if limit is not None else None,
+        )
+        if not include_content:
+            rows = [(stem, self._metadata(stem, prompt)) for stem, prompt in rows]
+        return build_page(rows, limit, total)
 
-        async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
-            content_yaml = await f.read()
+    def _metadata(self, title_stem: str, prompt: PromptRecord) -> PromptRecord:
+        # 元数据副本不引用目录中的content，调用方持有结果时不会让旧内容常驻内存
+        return prompt.without_content(self.catalog.content_loader(title_stem))
 
-        data = yaml.safe_load(content_yaml)
-        if not isinstance(data, dict):
-            print(f"Warning: Could not parse YAML as dictionary from {file_path}. Content: '{content_yaml[:100]}'...")
-            return None 
+    async def get_catalog_version(self) -> Optional[int]:
+        """获取prompt目录版本号（单调递增）"""
+        await self.catalog.scan()  # live模式下不访问文件系统
+        return self.catalog.version
 
-        stat = file_path.stat()
-
-        return Prompt(
-            title=data.get("title", title_stem), # Fallback to filename stem if title not in YAML
-            content=data.get("content", ""),
-            tags=[str(t) for t in data.get("tags", []) if isinstance(t, (str, int, float)) and str(t).strip()], # Ensure tags are strings and not empty
-            remark=data.get("remark", ""),
-            status=data.get("status", "enabled"),
-            created_at=datetime.fromtimestamp(stat.st_ctime),
-            updated_at=datetime.fromtimestamp(stat.st_mtime),
-            file_path=str(file_path),
-            creator_username=data.get("creator_username"),
-            usage_count=data.get("usage_count", 0), # Default to 0 if not present
-        )
+    def subscribe_changes(self, listener: ChangeListener) -> None:
+        """订阅提示词变更（本进程写入与目录监听器发现的外部修改）"""
+        self.catalog.subscribe(listener)
 
-    async def save_prompt(self, prompt_data: Dict[str, Any]) -> Prompt:
+    async def save_prompt(self, prompt_data: Dict[str, Any]) -> PromptRecord:
         """保存prompt"""
         title_for_filename = str(prompt_data["title"]).strip()
         if not title_for_filename:
@@ -77,8 +109,9 @@ class FileService:
             await f.write(
                 yaml.dump(yaml_data, allow_unicode=True, sort_keys=False, default_flow_style=False)
             )
-        
-        saved_prompt_obj = await self.read_prompt(title_for_filename)
+
+        # 本进程写入的文件强制重新解析（避免mtime精度不足导致命中旧缓存）
+        saved_prompt_obj = await self.catalog.refresh(title_for_filename, force=True)
         if not saved_prompt_obj:
             raise IOError(f"Failed to read back prompt '{title_for_filename}' after saving to {file_path}.")
         return saved_prompt_obj
@@ -88,12 +121,13 @@ class FileService:
         file_path = self.prompt_dir / f"{title_stem}.yaml"
         if file_path.exists():
             file_path.unlink()
+            self.catalog.remove(title_stem)
             return True
         return False
 
     async def update_prompt(
         self, original_title_identifier: str, update_data: Dict[str, Any]
-    ) -> Optional[Prompt]:
+    ) -> Optional[PromptRecord]:
         """更新prompt. original_title_identifier is the current unique ID (likely filename stem or current YAML title)."""
         
         existing_prompt_model = await self.read_prompt(original_title_identifier)
@@ -105,7 +139,7 @@ class FileService:
 
         current_yaml_title = existing_prompt_model.title 
 
-        data_to_save = existing_prompt_model.model_dump()
+        data_to_save = existing_prompt_model.to_dict()
         data_to_save.update(update_data)
 
         new_yaml_title = str(data_to_save.get("title", current_yaml_title)).strip()
@@ -124,6 +158,9 @@ class FileService:
                 raise ValueError(f"New title '{new_yaml_title}' conflicts with an existing prompt file: {new_file_path}")
             if original_file_path.exists():
                 original_file_path.rename(new_file_path)
+                await self.catalog.apply(
+                    PromptChange(ChangeType.RENAMED, new_yaml_title, original_title_identifier)
+                )
             else:
                 # This case means the file identified by original_title_identifier was not found to be renamed.
                 # This could happen if original_title_identifier was a YAML title that didn't match its filename stem.
@@ -135,63 +172,72 @@ class FileService:
         # If renamed, it writes to new_file_path. If not renamed, it overwrites original_file_path (or the one matching new_yaml_title if original_identifier was different).
         return await self.save_prompt(data_to_save)
 
-    async def search_prompts(self, query: str, search_in: List[str]) -> List[Prompt]:
-        """搜索prompts，根据关键词在指定字段中查找，并按匹配优先级排序。"""
-        print(f"[SEARCH_PROMPTS] Received query: '{query}', search_in: {search_in}")
-
-        all_prompts = await self.list_prompts()
-        if not all_prompts:
-            print("[SEARCH_PROMPTS] No prompts found to search.")
-            return []
-        
-        print(f"[SEARCH_PROMPTS] Loaded {len(all_prompts)} prompts for searching. Titles: {[p.title for p in all_prompts]}")
-
-        results = []
-        query_cleaned = query.strip().lower()
+    async def increment_usage(self, title: str, delta: int = 1) -> Optional[int]:
+        """增加使用次数，返回新计数；prompt不存在时返回None"""
+        return (await self.increment_usage_bulk({title: delta})).get(title)
 
-        if not query_cleaned:
-            print("[SEARCH_PROMPTS] Cleaned query is empty, returning no results.")
-            return []
-        
-        print(f"[SEARCH_PROMPTS] Cleaned query: '{query_cleaned}'")
+    async def increment_usage_bulk(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        """按 {标题: 增量} 批量增加使用次数，每个prompt只重写一次文件；返回更新后的计数。
 
-        for prompt in all_prompts:
+        只有使用次数变化的写入不算目录变更（见 PromptCatalog._store），不会使结果缓存失效或推送变更通知。
+        """
+        counts = {}
+        for title, delta in deltas.items():
+            # 重新stat，避免覆盖其他进程刚写入的计数
+            prompt = await self.catalog.refresh(title)
             if not prompt:
-                print("[SEARCH_PROMPTS] Encountered a None prompt object, skipping.")
+                print(f"Warning: prompt '{title}' not found while incrementing usage count.")
                 continue
-            
-            print(f"[SEARCH_PROMPTS] Evaluating prompt: '{prompt.title}'")
-                
-            score = 0
-            prompt_title_lower = str(prompt.title).lower() if prompt.title else ""
-            prompt_content_lower = str(prompt.content).lower() if prompt.content else ""
-            prompt_tags_lower = [str(t).lower() for t in prompt.tags if isinstance(t, str) and t.strip()] if prompt.tags else []
-
-            matched_in_title = "title" in search_in and query_cleaned in prompt_title_lower
-            matched_in_tags = False
-            if "tags" in search_in and prompt_tags_lower:
-                for tag_lower in prompt_tags_lower:
-                    if query_cleaned in tag_lower:
-                        matched_in_tags = True
-                        break
-            
-            matched_in_content = "content" in search_in and query_cleaned in prompt_content_lower
-
-            if matched_in_title:
-                score = 100
-            elif matched_in_tags:
-                score = 50
-            elif matched_in_content:
-                score = 10
-            
-            print(f"  - Calculated score for '{prompt.title}': {score}")
-
-            if score > 0:
-                results.append((score, prompt))
-
-        print(f"[SEARCH_PROMPTS] Unsorted results (score, title): {[(s, p.title) for s, p in results]}")
-        results.sort(key=lambda x: x[0], reverse=True)
-        
-        final_result_prompts = [p for _, p in results]
-        print(f"[SEARCH_PROMPTS] Sorted results returned (titles): {[p.title for p in final_result_prompts]}")
-        return final_result_prompts
+            updated = await self.update_prompt(title, {"usage_count": prompt.usage_count + delta})
+            if updated:
+                counts[title] = updated.usage_count
+        return counts
+
+    async def search_prompts(
+        self, query: str, search_in: List[str], ranking: str = RANKING_PRIORITY
+    ) -> List[PromptRecord]:
+        """搜索prompts，根据关键词在指定字段中查找，并按匹配优先级排序。"""
+        page = await self.search_prompts_page(query, search_in, ranking)
+        return [prompt for _, prompt in page.hits]
+
+    async def search_prompts_page(
+        self,
+        query: str,
+        search_in: List[str],
+        ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        enabled_only: bool = False,
+    ) -> SearchPage:
+        """搜索prompts并分页返回 (得分, prompt) 及命中总数"""
+        # 先同步目录（live模式下无文件系统访问），变更会通过监听器增量进入索引
+        await self.catalog.scan()
+        page = SearchPage([], 0)
+        for step in self.search_index.search_steps(
+            query, search_in, ranking=ranking, limit=limit, offset=offset,
+            enabled_only=enabled_only, chunk_size=settings.SEARCH_CHUNK_SIZE,
+        ):
+            if step is None:
+                # 块之间让出事件循环：可及时读取notifications/cancelled并在此停止
+                await asyncio.sleep(0)
+            else:
+                page = step
+        print(f"[SEARCH_PROMPTS] query: '{query}', search_in: {search_in}, ranking: {ranking}, matched: {page.total}")
+        return page
+
+    async def search_prompts_chunks(
+        self,
+        query: str,
+        search_in: List[str],
+        ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None,
+        enabled_only: bool = False,
+        chunk_size: int = settings.SEARCH_CHUNK_SIZE,
+    ) -> AsyncIterator[SearchProgress]:
+        """分块搜索，每校验完一块候选产出一次目前的top-k；块之间让出事件循环"""
+        await self.catalog.scan()
+        for progress in self.search_index.search_chunks(
+            query, search_in, ranking=ranking, limit=limit, enabled_only=enabled_only, chunk_size=chunk_size
+        ):
+            yield progress
+            await asyncio.sleep(0)
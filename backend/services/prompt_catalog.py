@@ -0,0 +1,387 @@
+"""
+进程级Prompt目录缓存 - 按文件 (inode, size, mtime) 判断是否需要重新解析
+"""
+import asyncio
+import bisect
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from backend.config import settings
+from backend.models import PromptRecord
+
+try:
+    # libyaml的C实现比纯Python的SafeLoader快一个数量级
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+
+# (st_ino, st_size, st_mtime_ns)
+FileSignature = Tuple[int, int, int]
+
+# 批量处理文件时每处理这么多条让出一次事件循环
+SCAN_YIELD_EVERY = 256
+
+
+class ChangeType(str, Enum):
+    CREATED = "created"
+    MODIFIED = "modified"
+    DELETED = "deleted"
+    RENAMED = "renamed"
+
+
+@dataclass(frozen=True)
+class PromptChange:
+    """单个prompt文件的变更事件"""
+
+    type: ChangeType
+    title_stem: str
+    old_title_stem: Optional[str] = None  # 仅RENAMED使用
+
+
+# 判断是否为内容变更时比较的字段：使用次数与文件时间戳的变化不算目录变更
+_CHANGE_FIELDS = tuple(
+    field for field in PromptRecord.FIELDS if field not in ("usage_count", "created_at", "updated_at")
+)
+
+# 监听器签名: (变更事件, 变更后的prompt；删除时为None)
+ChangeListener = Callable[[PromptChange, Optional[PromptRecord]], None]
+
+
+@dataclass
+class _CatalogEntry:
+    signature: FileSignature
+    prompt: PromptRecord
+
+
+def _signature(stat: os.stat_result) -> FileSignature:
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _read_yaml_file(file_path: str) -> Tuple[Any, str]:
+    """在工作线程/进程中读取并解析YAML，返回 (解析结果, 原文开头用于日志)"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        content_yaml = f.read()
+    return yaml.load(content_yaml, Loader=_SafeLoader), content_yaml[:100]
+
+
+def _list_yaml_files(prompt_dir: Path) -> Optional[List[Tuple[str, str, os.stat_result]]]:
+    """列出目录中的YAML文件及其stat，目录不存在时返回None"""
+    try:
+        it = os.scandir(prompt_dir)
+    except FileNotFoundError:
+        return None
+    files = []
+    with it:
+        for dir_entry in it:
+            if not dir_entry.name.endswith(".yaml"):
+                continue
+            try:
+                if not dir_entry.is_file():
+                    continue
+                files.append((dir_entry.name[: -len(".yaml")], dir_entry.path, dir_entry.stat()))
+            except FileNotFoundError:
+                continue  # 遍历过程中被删除
+    return files
+
+
+_parse_executor: Optional[Executor] = None
+
+
+def _get_parse_executor() -> Executor:
+    global _parse_executor
+    if _parse_executor is None:
+        if settings.PROMPT_PARSE_USE_PROCESSES:
+            _parse_executor = ProcessPoolExecutor(max_workers=settings.PROMPT_PARSE_WORKERS)
+        else:
+            _parse_executor = ThreadPoolExecutor(
+                max_workers=settings.PROMPT_PARSE_WORKERS, thread_name_prefix="prompt-parse"
+            )
+    return _parse_executor
+
+
+# YAML字段允许的类型（与PromptBase一致），类型不符的文件不进入目录
+_FIELD_TYPES = (
+    ("title", (str,)),
+    ("content", (str,)),
+    ("tags", (list,)),
+    ("remark", (str, type(None))),
+    ("status", (str, type(None))),
+    ("creator_username", (str, type(None))),
+)
+
+
+def build_prompt(title_stem: str, data: dict, file_path: Path, stat: os.stat_result) -> PromptRecord:
+    """将YAML解析结果转换为PromptRecord，字段类型不合法时抛出ValueError"""
+    for field, types in _FIELD_TYPES:
+        if field in data and not isinstance(data[field], types):
+            raise ValueError(f"Invalid type for '{field}': {type(data[field]).__name__}")
+    usage_count = data.get("usage_count", 0)
+    if not isinstance(usage_count, int) or isinstance(usage_count, bool):
+        raise ValueError(f"Invalid type for 'usage_count': {type(usage_count).__name__}")
+    return PromptRecord(
+        title=data.get("title", title_stem), # Fallback to filename stem if title not in YAML
+        content=data.get("content", ""),
+        tags=[str(t) for t in data.get("tags", []) if isinstance(t, (str, int, float)) and str(t).strip()], # Ensure tags are strings and not empty
+        remark=data.get("remark", ""),
+        status=data.get("status", "enabled"),
+        created_at=datetime.fromtimestamp(stat.st_ctime),
+        updated_at=datetime.fromtimestamp(stat.st_mtime),
+        file_path=str(file_path),
+        creator_username=data.get("creator_username"),
+        usage_count=data.get("usage_count", 0), # Default to 0 if not present
+    )
+
+
+class PromptCatalog:
+    """已解析Prompt的内存目录，以文件名（不含.yaml）为键。
+
+    list请求只需要一次目录遍历和每个文件一次stat，只有签名变化的文件才会重新解析。
+    挂载了文件监听器（live模式）后，目录由变更事件增量维护，list请求直接返回缓存。
+    """
+
+    def __init__(self, prompt_dir: Path):
+        self.prompt_dir = prompt_dir
+        self.live = False
+        self.version = 0  # 每次条目变化递增，供结果缓存判断是否过期
+        self._primed = False
+        self._entries: Dict[str, _CatalogEntry] = {}
+        self._order: Optional[List[str]] = None  # 排序后的文件名，条目增删时重建
+        self._listeners: List[ChangeListener] = []
+        self._scan_lock = asyncio.Lock()
+
+    def subscribe(self, listener: ChangeListener) -> None:
+        """注册变更监听器（搜索索引等内存结构通过它增量更新）"""
+        self._listeners.append(listener)
+
+    def items(self) -> List[Tuple[str, PromptRecord]]:
+        """当前缓存的 (文件名, prompt) 列表（不访问文件系统）"""
+        return [(stem, entry.prompt) for stem, entry in self._entries.items()]
+
+    def content_loader(self, title_stem: str) -> Callable[[], str]:
+        """延迟读取content的函数：条目仍在缓存中时直接取用，否则同步读取并解析文件。
+
+        后一种情况会阻塞事件循环，因此只作兜底：需要序列化content的调用方应以
+        include_content=True 查询（记录自带content），异步处理器中不要访问元数据记录的content。
+        """
+        def load() -> str:
+            entry = self._entries.get(title_stem)
+            if entry is not None:
+                return entry.prompt.content
+            data, _ = _read_yaml_file(str(self.prompt_dir / f"{title_stem}.yaml"))
+            return data.get("content", "") if isinstance(data, dict) else ""
+        return load
+
+    async def scan(self) -> List[PromptRecord]:
+        """同步目录状态并返回所有prompt（按文件名排序）"""
+        if self.live and self._primed:
+            return self._sorted_prompts()
+
+        async with self._scan_lock:
+            loop = asyncio.get_running_loop()
+            files = await loop.run_in_executor(None, _list_yaml_files, self.prompt_dir)
+            if files is None:
+                for stem in list(self._entries):
+                    self.remove(stem)
+                return []
+
+            seen = set()
+            stale = []
+            for stem, path, stat in files:
+                seen.add(stem)
+                entry = self._entries.get(stem)
+                if not entry or entry.signature != _signature(stat):
+                    stale.append((stem, Path(path), stat))
+
+            for stem in list(self._entries):
+                if stem not in seen:
+                    self.remove(stem)
+
+            # 变化的文件批量并发解析，解析完成后按原顺序写回
+            outcomes = await self._parse_many([path for _, path, _ in stale])
+            for i, ((stem, path, stat), outcome) in enumerate(zip(stale, outcomes)):
+                if i and i % SCAN_YIELD_EVERY == 0:
+                    # 让出事件循环：大目录重建时不阻塞其他请求，被取消的请求也能在此停止
+                    await asyncio.sleep(0)
+                if isinstance(outcome, BaseException):
+                    print(f"Error reading {path}: {outcome}")
+                    self.remove(stem)
+                    continue
+                data, head = outcome
+                try:
+                    self._store(stem, path, stat, data, head)
+                except Exception as e:
+                    # 单个文件内容不合法时跳过，不影响整个目录
+                    print(f"Error reading {path}: {e}")
+                    self.remove(stem)
+
+            self._primed = True
+            return self._sorted_prompts()
+
+    async def get(self, title_stem: str) -> Optional[PromptRecord]:
+        """读取单个prompt，文件未变化时直接返回缓存"""
+        if self.live:
+            entry = self._entries.get(title_stem)
+            if entry:
+                return entry.prompt
+        return await self.refresh(title_stem)
+
+    async def get_many(self, title_stems: List[str]) -> Dict[str, PromptRecord]:
+        """批量读取prompt，返回 {文件名: prompt}（不存在的不包含在结果中）"""
+        found: Dict[str, PromptRecord] = {}
+        misses = []
+        for stem in dict.fromkeys(title_stems):
+            entry = self._entries.get(stem) if self.live else None
+            if entry:
+                found[stem] = entry.prompt
+            else:
+                misses.append(stem)
+        if misses:
+            prompts = await asyncio.gather(*(self.refresh(stem) for stem in misses))
+            found.update((stem, prompt) for stem, prompt in zip(misses, prompts) if prompt is not None)
+        return found
+
+    async def refresh(self, title_stem: str, force: bool = False) -> Optional[PromptRecord]:
+        """重新stat指定文件，签名变化（或force）时重新解析；文件不存在时移除缓存"""
+        file_path = self.prompt_dir / f"{title_stem}.yaml"
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            self.remove(title_stem)
+            return None
+        return await self._load(title_stem, file_path, stat, force=force)
+
+    def remove(self, title_stem: str) -> None:
+        """丢弃指定文件的缓存（文件被删除时调用）"""
+        if self._entries.pop(title_stem, None) is not None:
+            self._order = None
+            self._notify(PromptChange(ChangeType.DELETED, title_stem), None)
+
+    async def apply(self, change: PromptChange) -> None:
+        """应用一条文件变更事件，只解析受影响的文件"""
+        if change.type == ChangeType.DELETED:
+            self.remove(change.title_stem)
+            return
+
+        if change.type == ChangeType.RENAMED and change.old_title_stem:
+            old_entry = self._entries.pop(change.old_title_stem, None)
+            self._order = None
+            file_path = self.prompt_dir / f"{change.title_stem}.yaml"
+            try:
+                prompt = await self._load(change.title_stem, file_path, file_path.stat(), notify=False)
+            except FileNotFoundError:
+                prompt = None
+            except Exception as e:
+                print(f"Error reading {file_path}: {e}")
+                prompt = None
+            if old_entry is not None and prompt is not None:
+                self._notify(change, prompt)
+            elif old_entry is not None:
+                self._notify(PromptChange(ChangeType.DELETED, change.old_title_stem), None)
+            elif prompt is not None:
+                self._notify(PromptChange(ChangeType.CREATED, change.title_stem), prompt)
+            return
+
+        try:
+            await self.refresh(change.title_stem)
+        except Exception as e:
+            print(f"Error reading {change.title_stem}.yaml: {e}")
+            self.remove(change.title_stem)
+
+    async def _load(
+        self, title_stem: str, file_path: Path, stat: os.stat_result, notify: bool = True, force: bool = False
+    ) -> Optional[PromptRecord]:
+        entry = self._entries.get(title_stem)
+        if entry and entry.signature == _signature(stat) and not force:
+            return entry.prompt
+
+        loop = asyncio.get_running_loop()
+        data, head = await loop.run_in_executor(_get_parse_executor(), _read_yaml_file, str(file_path))
+        return self._store(title_stem, file_path, stat, data, head, notify=notify)
+
+    async def _parse_many(self, paths: List[Path]) -> List[Any]:
+        """在受限的线程/进程池中并发读取并解析文件，结果与paths顺序一致，异常作为结果返回"""
+        if not paths:
+            return []
+        loop = asyncio.get_running_loop()
+        executor = _get_parse_executor()
+        futures = [loop.run_in_executor(executor, _read_yaml_file, str(path)) for path in paths]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    def _store(
+        self, title_stem: str, file_path: Path, stat: os.stat_result, data: Any, head: str, notify: bool = True
+    ) -> Optional[PromptRecord]:
+        entry = self._entries.get(title_stem)
+        if not isinstance(data, dict):
+            print(f"Warning: Could not parse YAML as dictionary from {file_path}. Content: '{head}'...")
+            if notify:
+                self.remove(title_stem)
+            elif self._entries.pop(title_stem, None) is not None:
+                self._order = None
+            return None
+
+        prompt = build_prompt(title_stem, data, file_path, stat)
+        if entry is not None and all(getattr(entry.prompt, f) == getattr(prompt, f) for f in _CHANGE_FIELDS):
+            # 只有使用次数变化（使用统计写回）：原地更新缓存记录，保留原更新时间，
+            # 不通知监听器、不递增版本，结果缓存、快照和变更通知都不受影响
+            entry.prompt.usage_count = prompt.usage_count
+            entry.signature = _signature(stat)
+            return entry.prompt
+
+        self._entries[title_stem] = _CatalogEntry(signature=_signature(stat), prompt=prompt)
+        if entry is None:
+            self._order = None
+        if notify:
+            change_type = ChangeType.MODIFIED if entry else ChangeType.CREATED
+            self._notify(PromptChange(change_type, title_stem), prompt)
+        return prompt
+
+    def page_after(
+        self, after: Optional[str], limit: int, predicate: Optional[Callable[[PromptRecord], bool]] = None
+    ) -> List[Tuple[str, PromptRecord]]:
+        """按文件名顺序返回after之后满足条件的最多limit条 (文件名, prompt)（不访问文件系统）"""
+        order = self._sorted_keys()
+        start = bisect.bisect_right(order, after) if after is not None else 0
+        page = []
+        for stem in order[start:]:
+            prompt = self._entries[stem].prompt
+            if predicate is None or predicate(prompt):
+                page.append((stem, prompt))
+                if len(page) >= limit:
+                    break
+        return page
+
+    def _sorted_keys(self) -> List[str]:
+        if self._order is None:
+            self._order = sorted(self._entries)
+        return self._order
+
+    def _sorted_prompts(self) -> List[PromptRecord]:
+        return [self._entries[stem].prompt for stem in self._sorted_keys()]
+
+    def _notify(self, change: PromptChange, prompt: Optional[PromptRecord]) -> None:
+        self.version += 1
+        for listener in self._listeners:
+            try:
+                listener(change, prompt)
+            except Exception as e:
+                print(f"Error in prompt catalog listener for '{change.title_stem}': {e}")
+
+
+_catalogs: Dict[Path, PromptCatalog] = {}
+
+
+def get_prompt_catalog(prompt_dir: Path) -> PromptCatalog:
+    """获取指定目录的进程级目录缓存实例"""
+    key = prompt_dir.resolve()
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        catalog = PromptCatalog(prompt_dir)
+        _catalogs[key] = catalog
+    return catalog
@@ -0,0 +1,74 @@
+"""
+prompt列表查询 - 过滤条件与按 (updated_at 降序, 标题 升序) 的键集分页游标，文件存储与数据库存储共用
+"""
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Tuple
+
+from backend.models import PromptRecord
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class PromptFilter(NamedTuple):
+    """列表过滤条件，未设置的条件不生效"""
+
+    status: Optional[str] = None
+    tag: Optional[str] = None
+    creator_username: Optional[str] = None
+    q: Optional[str] = None  # 标题/标签/内容子串，不区分大小写
+
+
+class ListCursor(NamedTuple):
+    """上一页最后一条的位置，以及第一页时统计的总数"""
+
+    updated_at: datetime
+    key: str
+    total: Optional[int] = None
+
+
+class PromptListPage(NamedTuple):
+    """一页列表结果：total为满足条件的总数（近似值：翻页期间目录可能变化）"""
+
+    prompts: List[PromptRecord]
+    next_cursor: Optional[str]
+    total: Optional[int]
+
+
+def timestamp_micros(value: datetime) -> int:
+    """datetime转为整数微秒（带时区的先转为UTC），用于精确比较和排序"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def recency_key(updated_at: datetime, key: str) -> Tuple[int, str]:
+    """升序排列即为 更新时间从新到旧、同一时间按键升序"""
+    return (-timestamp_micros(updated_at), key)
+
+
+def encode_cursor(updated_at: datetime, key: str, total: Optional[int]) -> str:
+    data = {"u": updated_at.isoformat(), "k": key}
+    if total is not None:
+        data["n"] = total
+    return base64.urlsafe_b64encode(json.dumps(data, ensure_ascii=False).encode("utf-8")).decode()
+
+
+def decode_cursor(cursor: str) -> ListCursor:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return ListCursor(datetime.fromisoformat(data["u"]), str(data["k"]), data.get("n"))
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def build_page(
+    rows: List[Tuple[str, PromptRecord]], limit: Optional[int], total: Optional[int]
+) -> PromptListPage:
+    """rows按顺序排列，分页时多取一条用于判断是否还有下一页"""
+    if limit is None or len(rows) <= limit:
+        return PromptListPage([prompt for _, prompt in rows], None, total)
+    rows = rows[:limit]
+    key, last = rows[-1]
+    return PromptListPage([prompt for _, prompt in rows], encode_cursor(last.updated_at, key, total), total)
@@ -3,7 +3,7 @@ from typing import Any, Dict, List, Optional
 from fastapi import HTTPException
 
 from backend.config import settings
-from backend.models import Prompt, PromptCreate, PromptUpdate
+from backend.models import PromptCreate, PromptRecord, PromptUpdate
 from backend.utils.validators import (validate_content, validate_tags,
                                       validate_title)
 
@@ -12,12 +12,8 @@ class PromptService:
     """Prompt业务逻辑服务"""
 
     def __init__(self):
-        if settings.USE_DATABASE:
-            from backend.services.db_service import DatabaseService
-            self.storage_service = DatabaseService()
-        else:
-            from backend.services.file_service import FileService
-            self.storage_service = FileService()
+        from backend.services.service_factory import get_prompt_service
+        self.storage_service = get_prompt_service()
         
         # 导入标签服务
         from backend.services.unified_tag_service import tag_service
@@ -25,7 +21,7 @@ class PromptService:
 
     async def create_prompt(
         self, prompt_data: PromptCreate, creator_username: str
-    ) -> Prompt:
+    ) -> PromptRecord:
         """创建新的prompt，并将其中的tags同步到全局tags.json"""
         # 验证数据
         if not validate_title(prompt_data.title):
@@ -62,7 +58,7 @@ class PromptService:
 
     async def update_prompt(
         self, title: str, update_data: PromptUpdate, current_username: str
-    ) -> Optional[Prompt]:
+    ) -> Optional[PromptRecord]:
         """更新prompt，并将其中的tags同步到全局tags.json"""
         # 获取原始prompt
         original_prompt = await self.storage_service.read_prompt(title)
@@ -115,7 +111,7 @@ class PromptService:
 
     async def toggle_prompt_status(
         self, title: str, current_username: str
-    ) -> Optional[Prompt]:
+    ) -> Optional[PromptRecord]:
         """切换prompt状态，校验操作者是否为创建者"""
         original_prompt = await self.storage_service.read_prompt(title)
         if not original_prompt:
@@ -127,7 +123,7 @@ class PromptService:
         new_status = "disabled" if original_prompt.status == "enabled" else "enabled"
         return await self.storage_service.update_prompt(title, {"status": new_status})
 
-    async def get_enabled_prompts(self) -> List[Prompt]:
+    async def get_enabled_prompts(self) -> List[PromptRecord]:
         """获取所有启用的prompts"""
         all_prompts = await self.storage_service.list_prompts()
         return [p for p in all_prompts if p.status == "enabled"]
@@ -145,23 +141,13 @@ class PromptService:
                         all_tags.add(tag_from_yaml.strip())
         return sorted(list(all_tags))
 
-    async def increment_usage_count(self, title: str) -> Optional[Prompt]:
+    async def increment_usage_count(self, title: str) -> Optional[PromptRecord]:
         """增加指定prompt的使用次数"""
-        prompt = await self.storage_service.read_prompt(title)
-        if not prompt:
-            # No need to raise HTTPException here if called internally, 
-            # but good if this service method could also be called directly from API in future.
-            # For now, let's assume API layer handles 404 if needed.
-            # Consider returning None or letting file_service.update_prompt handle it.
-            return None 
-
-        new_usage_count = prompt.usage_count + 1
-        # We need to ensure that update_prompt can handle just updating usage_count
-        # and that it correctly identifies the prompt by its title (which is the identifier here)
-        updated_prompt = await self.storage_service.update_prompt(
-            title, {"usage_count": new_usage_count}
-        )
-        return updated_prompt
+        # 存储层原子递增，并发请求不会丢失计数
+        new_usage_count = await self.storage_service.increment_usage(title)
+        if new_usage_count is None:
+            return None
+        return await self.storage_service.read_prompt(title)
 
 
 async def get_prompt_by_username_count(username: str) -> int:
@@ -0,0 +1,230 @@
+"""
+prompt-template目录监听器 - 将文件事件转换为PromptChange并增量应用到PromptCatalog
+
+Linux下直接使用inotify（通过ctypes，无额外依赖），其他平台或inotify不可用时退化为定时stat轮询。
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from typing import Dict, List, Optional
+
+from backend.config import settings
+from backend.services.prompt_catalog import ChangeType, PromptCatalog, PromptChange
+
+logger = logging.getLogger(__name__)
+
+# inotify事件掩码（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class _Inotify:
+    """最小化的inotify封装"""
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, path.encode(), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+
+    def read_events(self) -> List[tuple]:
+        """读取当前可用的全部事件: [(mask, cookie, name), ...]"""
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                _wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+                offset += length
+                events.append((mask, cookie, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _stem(name: str) -> Optional[str]:
+    return name[: -len(".yaml")] if name.endswith(".yaml") else None
+
+
+def translate_inotify_events(events: List[tuple]) -> Optional[List[PromptChange]]:
+    """将一批inotify原始事件合并为PromptChange列表；需要全量重扫时返回None"""
+    changes: Dict[str, PromptChange] = {}
+    moved_from: Dict[int, str] = {}
+    created = set()
+
+    for mask, cookie, name in events:
+        if mask & IN_Q_OVERFLOW:
+            return None
+        stem = _stem(name)
+
+        if mask & IN_MOVED_FROM:
+            if stem is not None:
+                moved_from[cookie] = stem
+                changes[stem] = PromptChange(ChangeType.DELETED, stem)
+        elif mask & IN_MOVED_TO:
+            if stem is None:
+                continue
+            old_stem = moved_from.pop(cookie, None)
+            if old_stem is not None:
+                changes.pop(old_stem, None)
+                changes[stem] = PromptChange(ChangeType.RENAMED, stem, old_stem)
+            else:
+                # 编辑器常见的"写临时文件再rename"也会走到这里
+                changes[stem] = PromptChange(ChangeType.MODIFIED, stem)
+        elif stem is None:
+            continue
+        elif mask & IN_CREATE:
+            created.add(stem)
+        elif mask & IN_CLOSE_WRITE:
+            change_type = ChangeType.CREATED if stem in created else ChangeType.MODIFIED
+            changes[stem] = PromptChange(change_type, stem)
+        elif mask & IN_DELETE:
+            created.discard(stem)
+            changes[stem] = PromptChange(ChangeType.DELETED, stem)
+
+    return list(changes.values())
+
+
+class PromptWatcher:
+    """以asyncio任务运行的目录监听器"""
+
+    def __init__(
+        self,
+        catalog: PromptCatalog,
+        poll_interval: float = settings.PROMPT_WATCH_POLL_INTERVAL,
+        debounce: float = settings.PROMPT_WATCH_DEBOUNCE,
+    ):
+        self.catalog = catalog
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.mode: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """启动监听任务（幂等）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="prompt-watcher")
+        return self._task
+
+    async def stop(self) -> None:
+        """停止监听任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.catalog.live = False
+
+    async def _run(self) -> None:
+        # 先做一次全量扫描建立基线，之后只处理增量事件
+        await self.catalog.scan()
+        self.catalog.live = True
+        try:
+            inotify = _Inotify(str(self.catalog.prompt_dir))
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify unavailable ({e}), falling back to polling every {self.poll_interval}s")
+            self.mode = "poll"
+            await self._poll_loop()
+            return
+
+        self.mode = "inotify"
+        logger.info(f"Watching {self.catalog.prompt_dir} with inotify")
+        try:
+            await self._inotify_loop(inotify)
+        finally:
+            inotify.close()
+
+        # 目录本身被删除或移动，inotify监听失效，改为轮询
+        logger.warning(f"Lost inotify watch on {self.catalog.prompt_dir}, falling back to polling")
+        self.mode = "poll"
+        await self._rescan()
+        await self._poll_loop()
+
+    async def _inotify_loop(self, inotify: _Inotify) -> None:
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(inotify.fd, readable.set)
+        try:
+            while True:
+                await readable.wait()
+                # 合并短时间内的突发事件（保存时通常会连续触发多次）
+                await asyncio.sleep(self.debounce)
+                readable.clear()
+                events = inotify.read_events()
+                if any(mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED) for mask, _, _ in events):
+                    return
+                changes = translate_inotify_events(events)
+                if changes is None:
+                    logger.warning("inotify queue overflow, rescanning prompt directory")
+                    await self._rescan()
+                    continue
+                for change in changes:
+                    await self.catalog.apply(change)
+        finally:
+            loop.remove_reader(inotify.fd)
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self._rescan()
+
+    async def _rescan(self) -> None:
+        # 全量stat扫描：目录内容与缓存签名比对，只重新解析变化的文件
+        self.catalog.live = False
+        try:
+            await self.catalog.scan()
+        except Exception as e:
+            logger.error(f"Error rescanning prompt directory: {e}")
+        finally:
+            self.catalog.live = True
+
+
+_watchers: Dict[int, PromptWatcher] = {}
+
+
+def start_prompt_watcher(catalog: PromptCatalog) -> Optional[PromptWatcher]:
+    """为目录缓存启动监听器（同一目录只启动一个）"""
+    if not settings.PROMPT_WATCH_ENABLED:
+        return None
+    watcher = _watchers.get(id(catalog))
+    if watcher is None:
+        watcher = PromptWatcher(catalog)
+        _watchers[id(catalog)] = watcher
+    watcher.start()
+    return watcher
+
+
+async def stop_prompt_watchers() -> None:
+    """停止本进程内的所有监听器"""
+    for watcher in list(_watchers.values()):
+        await watcher.stop()
+    _watchers.clear()
@@ -0,0 +1,365 @@
+"""
+Prompt内存倒排索引 - 基于字符n-gram，无需分词即可支持中文等CJK文本的子串搜索
+"""
+import bisect
+from collections import Counter
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from backend.models import PromptRecord
+from backend.services.prompt_catalog import ChangeType, PromptCatalog, PromptChange
+from backend.services.prompt_query import PromptFilter, recency_key
+from backend.services.search_scoring import (BM25_FIELD_WEIGHTS, FIELD_SCORES,
+                                             RANKING_BM25, RANKING_PRIORITY,
+                                             SearchPage, SearchProgress, bm25_idf,
+                                             bm25_tf, query_grams, rank_scored)
+
+# 列表查询按精确值过滤的字段
+FILTER_FIELDS = ("status", "tags", "creator_username")
+# 过滤后的候选数不超过总数的 1/该值 时直接对候选排序，否则沿按时间排序的键表扫描
+_SORT_CANDIDATES_RATIO = 8
+
+
+def text_grams(text: str) -> Counter:
+    """文本中单字和二元字符组的出现次数（已小写）"""
+    grams = Counter(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+@dataclass
+class _IndexedDoc:
+    prompt: PromptRecord
+    title: str
+    tags: List[str]
+    content: str
+
+    @classmethod
+    def from_prompt(cls, prompt: PromptRecord) -> "_IndexedDoc":
+        return cls(
+            prompt=prompt,
+            title=str(prompt.title).lower() if prompt.title else "",
+            tags=[str(t).lower() for t in prompt.tags if isinstance(t, str) and t.strip()] if prompt.tags else [],
+            content=str(prompt.content).lower() if prompt.content else "",
+        )
+
+    def field_matches(self, field: str, query: str) -> bool:
+        if field == "title":
+            return query in self.title
+        if field == "tags":
+            return any(query in tag for tag in self.tags)
+        return query in self.content
+
+    def field_length(self, field: str) -> int:
+        if field == "title":
+            return len(self.title)
+        if field == "tags":
+            return sum(len(tag) for tag in self.tags)
+        return len(self.content)
+
+
+class PromptSearchIndex:
+    """按字段（title/tags/content）分别维护倒排表的n-gram索引。
+
+    子串查询先对查询串的n-gram倒排表求交得到候选集，再只对候选做子串校验。
+    倒排表记录词频，并增量维护各字段总长度，供BM25排序使用。
+    列表查询另外维护按更新时间排序的键表和 status/tags/creator_username 的 值 -> 键集合。
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, _IndexedDoc] = {}
+        # field -> gram -> {key: tf}
+        self._postings: Dict[str, Dict[str, Dict[str, int]]] = {field: {} for field, _ in FIELD_SCORES}
+        self._field_length_totals: Dict[str, int] = {field: 0 for field, _ in FIELD_SCORES}
+        # field -> value -> {key}
+        self._filter_keys: Dict[str, Dict[str, Set[str]]] = {field: {} for field in FILTER_FIELDS}
+        self._recency: Dict[str, Tuple[int, str]] = {}
+        # 排序后的recency键，首次列表查询时建立（避免冷启动逐条插入），之后增量维护
+        self._recent: Optional[List[Tuple[int, str]]] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, key: str, prompt: PromptRecord) -> None:
+        """索引一个prompt（已存在时先移除旧版本）"""
+        self.remove(key)
+        doc = _IndexedDoc.from_prompt(prompt)
+        self._docs[key] = doc
+        for field, grams in self._doc_grams(doc).items():
+            postings = self._postings[field]
+            for gram, tf in grams.items():
+                postings.setdefault(gram, {})[key] = tf
+            self._field_length_totals[field] += doc.field_length(field)
+
+        for field in FILTER_FIELDS:
+            for value in _filter_values(prompt, field):
+                self._filter_keys[field].setdefault(value, set()).add(key)
+        rank = recency_key(prompt.updated_at, key)
+        self._recency[key] = rank
+        if self._recent is not None:
+            bisect.insort(self._recent, rank)
+
+    def remove(self, key: str) -> None:
+        """从索引中移除一个prompt"""
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for field, grams in self._doc_grams(doc).items():
+            postings = self._postings[field]
+            for gram in grams:
+                keys = postings.get(gram)
+                if keys is None:
+                    continue
+                keys.pop(key, None)
+                if not keys:
+                    del postings[gram]
+            self._field_length_totals[field] -= doc.field_length(field)
+
+        for field in FILTER_FIELDS:
+            values = self._filter_keys[field]
+            for value in _filter_values(doc.prompt, field):
+                keys = values.get(value)
+                if keys is None:
+                    continue
+                keys.discard(key)
+                if not keys:
+                    del values[value]
+        rank = self._recency.pop(key)
+        if self._recent is not None:
+            i = bisect.bisect_left(self._recent, rank)
+            if i < len(self._recent) and self._recent[i] == rank:
+                del self._recent[i]
+
+    def on_catalog_change(self, change: PromptChange, prompt: Optional[PromptRecord]) -> None:
+        """PromptCatalog监听器：按变更事件增量更新索引"""
+        if change.type == ChangeType.RENAMED and change.old_title_stem:
+            self.remove(change.old_title_stem)
+        if prompt is None:
+            self.remove(change.title_stem)
+        else:
+            self.add(change.title_stem, prompt)
+
+    def match_keys(self, query: str, search_in: List[str]) -> Set[str]:
+        """任一指定字段包含query（不区分大小写）的键集合"""
+        query_cleaned = query.strip().lower()
+        grams = query_grams(query_cleaned)
+        matched: Set[str] = set()
+        for field, _ in FIELD_SCORES:
+            if field not in search_in:
+                continue
+            for key in self._candidates(field, grams):
+                if key not in matched and self._docs[key].field_matches(field, query_cleaned):
+                    matched.add(key)
+        return matched
+
+    def list_page(
+        self, filters: PromptFilter, after: Optional[Tuple[int, str]], limit: Optional[int]
+    ) -> Tuple[List[Tuple[str, PromptRecord]], int]:
+        """按更新时间从新到旧返回after（recency键）之后满足条件的最多limit条 (键, prompt)，以及满足条件的总数。
+
+        各过滤条件先由精确值表和n-gram索引求出候选集：候选较少时只对候选排序，
+        否则沿排序键表顺序扫描，每页的开销与页大小而非目录大小相关。
+        """
+        key_sets = [
+            self._filter_keys[field].get(value, set())
+            for field, value in (
+                ("status", filters.status), ("tags", filters.tag), ("creator_username", filters.creator_username)
+            )
+            if value is not None
+        ]
+        if filters.q and filters.q.strip():
+            key_sets.append(self.match_keys(filters.q, [field for field, _ in FIELD_SCORES]))
+
+        candidates: Optional[Set[str]] = None
+        if key_sets:
+            key_sets.sort(key=len)
+            candidates = key_sets[0].intersection(*key_sets[1:]) if len(key_sets) > 1 else key_sets[0]
+        total = len(self._docs) if candidates is None else len(candidates)
+
+        if candidates is not None and len(candidates) * _SORT_CANDIDATES_RATIO <= len(self._docs):
+            ordered = sorted(self._recency[key] for key in candidates)
+        else:
+            if self._recent is None:
+                self._recent = sorted(self._recency.values())
+            ordered = self._recent
+        start = bisect.bisect_right(ordered, after) if after is not None else 0
+        ranks: Iterable[Tuple[int, str]] = (ordered[i] for i in range(start, len(ordered)))
+        if candidates is not None and ordered is self._recent:
+            ranks = (rank for rank in ranks if rank[1] in candidates)
+        if limit is not None:
+            ranks = islice(ranks, limit)
+        return [(key, self._docs[key].prompt) for _, key in ranks], total
+
+    def search_chunks(
+        self,
+        query: str,
+        search_in: List[str],
+        ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None,
+        enabled_only: bool = False,
+        chunk_size: int = 500,
+    ) -> Iterator[SearchProgress]:
+        """分块执行搜索：候选按块校验和打分，每块结束产出一次目前的top-k。
+
+        最后一次产出的结果与 search_steps(offset=0) 相同。
+        """
+        if not query.strip():
+            yield SearchProgress(0, 0, SearchPage([], 0))
+            return
+        for done, total, scored, found in self._verify_chunks(query, search_in, ranking, enabled_only, chunk_size):
+            yield SearchProgress(done, total, self._page(scored, limit, 0, found))
+
+    def search_steps(
+        self,
+        query: str,
+        search_in: List[str],
+        ranking: str = RANKING_PRIORITY,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        enabled_only: bool = False,
+        chunk_size: int = 500,
+    ) -> Iterator[Optional[SearchPage]]:
+        """子串搜索：按块校验候选，每块之后产出None，最后产出按得分从高到低的一页结果及命中总数。
+
+        priority模式按 标题 > 标签 > 内容 分档；bm25模式只对命中的候选计算字段加权BM25。
+        只需前k条时用堆选取，不对全部命中排序。调用方在两次产出之间让出事件循环，
+        请求被取消时可在块之间停止。
+        """
+        scored: List[Tuple[float, str]] = []
+        found: Dict[str, PromptRecord] = {}
+        if query.strip():
+            for _, _, scored, found in self._verify_chunks(query, search_in, ranking, enabled_only, chunk_size):
+                yield None
+        yield self._page(scored, limit, offset, found)
+
+    def _verify_chunks(
+        self, query: str, search_in: List[str], ranking: str, enabled_only: bool, chunk_size: int
+    ) -> Iterator[Tuple[int, int, List[Tuple[float, str]], Dict[str, PromptRecord]]]:
+        """按块校验候选并打分，每块结束产出 (已处理块数, 总块数, 目前的得分列表, 命中的prompt)"""
+        query_cleaned = query.strip().lower()
+        grams = query_grams(query_cleaned)
+        fields = [
+            (field, field_score, self._candidates(field, grams))
+            for field, field_score in FIELD_SCORES
+            if field in search_in
+        ]
+        keys = sorted(set().union(*(candidates for _, _, candidates in fields)))
+        chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)] or [[]]
+
+        # 块之间调用方可能让出事件循环，期间索引可能变化：已命中的prompt在此保存
+        scored: List[Tuple[float, str]] = []
+        found: Dict[str, PromptRecord] = {}
+        for done, chunk in enumerate(chunks, 1):
+            for key in chunk:
+                doc = self._docs.get(key)
+                if doc is None:
+                    continue
+                if enabled_only and doc.prompt.status != "enabled":
+                    continue
+                # 按 标题 > 标签 > 内容 取第一个真正命中的字段
+                field_score = next(
+                    (score for field, score, candidates in fields
+                     if key in candidates and doc.field_matches(field, query_cleaned)),
+                    None,
+                )
+                if field_score is None:
+                    continue
+                found[key] = doc.prompt
+                if ranking == RANKING_BM25:
+                    scored.append((self._bm25_score(key, grams, search_in), key))
+                else:
+                    scored.append((float(field_score), key))
+            yield done, len(chunks), scored, found
+
+    def _page(
+        self,
+        scored: List[Tuple[float, str]],
+        limit: Optional[int],
+        offset: int,
+        prompts: Dict[str, PromptRecord],
+    ) -> SearchPage:
+        # 同分按key排序，保证结果稳定
+        ranked = rank_scored(scored, limit, offset)
+        return SearchPage([(score, prompts[key]) for score, key in ranked], len(scored))
+
+    def _bm25_score(self, key: str, grams: List[str], search_in: List[str]) -> float:
+        doc = self._docs[key]
+        doc_count = len(self._docs)
+        score = 0.0
+        for field, _ in FIELD_SCORES:
+            if field not in search_in:
+                continue
+            postings = self._postings[field]
+            avg_length = self._field_length_totals[field] / doc_count
+            field_length = doc.field_length(field)
+            field_score = 0.0
+            for gram in grams:
+                keys = postings.get(gram)
+                if not keys or key not in keys:
+                    continue
+                field_score += bm25_idf(len(keys), doc_count) * bm25_tf(keys[key], field_length, avg_length)
+            score += BM25_FIELD_WEIGHTS[field] * field_score
+        return score
+
+    def _candidates(self, field: str, grams: Iterable[str]) -> Set[str]:
+        postings = self._postings[field]
+        lists = []
+        for gram in grams:
+            keys = postings.get(gram)
+            if not keys:
+                return set()
+            lists.append(keys)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for keys in lists[1:]:
+            candidates.intersection_update(keys.keys())
+            if not candidates:
+                break
+        return candidates
+
+    @staticmethod
+    def _doc_grams(doc: _IndexedDoc) -> Dict[str, Counter]:
+        tag_grams: Counter = Counter()
+        for tag in doc.tags:
+            tag_grams.update(text_grams(tag))
+        return {
+            "title": text_grams(doc.title),
+            "tags": tag_grams,
+            "content": text_grams(doc.content),
+        }
+
+
+def _filter_values(prompt: PromptRecord, field: str) -> List[str]:
+    if field == "tags":
+        return list(prompt.tags or [])
+    value = getattr(prompt, field)
+    return [] if value is None else [value]
+
+
+def index_document(prompt: PromptRecord) -> Tuple[Dict[str, int], Dict[str, Counter]]:
+    """prompt各字段的索引长度及n-gram词频（与PromptSearchIndex一致），供目录快照使用"""
+    doc = _IndexedDoc.from_prompt(prompt)
+    lengths = {field: doc.field_length(field) for field, _ in FIELD_SCORES}
+    return lengths, PromptSearchIndex._doc_grams(doc)
+
+
+def match_score(prompt: PromptRecord, fields: Iterable[Tuple[str, int]], query: str) -> Optional[int]:
+    """按给定顺序返回prompt第一个包含query（已小写）的字段的得分，都不包含时返回None"""
+    doc = _IndexedDoc.from_prompt(prompt)
+    return next((score for field, score in fields if doc.field_matches(field, query)), None)
+
+
+_indexes: Dict[int, PromptSearchIndex] = {}
+
+
+def get_prompt_search_index(catalog: PromptCatalog) -> PromptSearchIndex:
+    """获取与目录缓存绑定的搜索索引（首次调用时用目录现有条目建立索引并订阅后续变更）"""
+    index = _indexes.get(id(catalog))
+    if index is None:
+        index = PromptSearchIndex()
+        for key, prompt in catalog.items():
+            index.add(key, prompt)
+        catalog.subscribe(index.on_catalog_change)
+        _indexes[id(catalog)] = index
+    return index
@@ -0,0 +1,66 @@
+"""
+搜索打分规则 - 文件存储、数据库存储与MCP搜索共用
+"""
+import heapq
+import math
+from typing import List, NamedTuple, Optional, Tuple, TypeVar
+
+from backend.models import PromptRecord
+
+K = TypeVar("K")
+
+RANKING_PRIORITY = "priority"  # 固定分档：标题 > 标签 > 内容
+RANKING_BM25 = "bm25"  # 按字段加权的BM25相关度
+RANKING_MODES = (RANKING_PRIORITY, RANKING_BM25)
+
+# 字段优先级与匹配得分
+FIELD_SCORES: Tuple[Tuple[str, int], ...] = (("title", 100), ("tags", 50), ("content", 10))
+
+# BM25参数，字段权重沿用 标题 > 标签 > 内容 的优先级
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_FIELD_WEIGHTS = {"title": 10.0, "tags": 5.0, "content": 1.0}
+
+
+class SearchPage(NamedTuple):
+    """一页搜索结果：hits为 (得分, prompt) 列表，total为全部命中数"""
+
+    hits: List[Tuple[float, PromptRecord]]
+    total: int
+
+
+class SearchProgress(NamedTuple):
+    """分块搜索的进度：已处理块数/总块数，page为目前为止合并出的top-k（total为目前的命中数）"""
+
+    scanned: int
+    total: int
+    page: SearchPage
+
+
+def query_grams(query: str) -> List[str]:
+    """查询串的n-gram：单字查询用unigram，否则用全部bigram（去重，保持顺序）"""
+    if len(query) == 1:
+        return [query]
+    return list(dict.fromkeys(query[i:i + 2] for i in range(len(query) - 1)))
+
+
+def bm25_idf(df: int, doc_count: int) -> float:
+    """BM25逆文档频率（非负形式）"""
+    return math.log(1.0 + (doc_count - df + 0.5) / (df + 0.5))
+
+
+def bm25_tf(tf: float, field_length: float, avg_field_length: float) -> float:
+    """BM25词频饱和与长度归一化部分"""
+    if tf <= 0:
+        return 0.0
+    norm = 1.0 - BM25_B + BM25_B * (field_length / avg_field_length if avg_field_length else 1.0)
+    return tf * (BM25_K1 + 1.0) / (tf + BM25_K1 * norm)
+
+
+def rank_scored(scored: List[Tuple[float, K]], limit: Optional[int], offset: int = 0) -> List[Tuple[float, K]]:
+    """按得分从高到低（同分按key）取一页；只需前k条时用堆选取，不对全部命中排序"""
+    if limit is not None and offset + limit < len(scored):
+        ranked = heapq.nsmallest(offset + limit, scored, key=lambda item: (-item[0], item[1]))
+    else:
+        ranked = sorted(scored, key=lambda item: (-item[0], item[1]))
+    return ranked[offset:] if limit is None else ranked[offset:offset + limit]
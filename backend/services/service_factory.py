@@ -1,20 +1,62 @@
 """
 服务工厂 - 根据配置选择使用文件服务还是数据库服务
 """
-from typing import Protocol, List, Optional, Dict, Any
+from functools import lru_cache
+from typing import Protocol, AsyncIterator, List, Optional, Dict, Any, Tuple
 
 from backend.config import settings
-from backend.models import Prompt, PromptCreate, PromptUpdate, UserCreate, UserInDB
+from backend.models import PromptCreate, PromptRecord, PromptUpdate, UserCreate, UserInDB
+from backend.services.prompt_catalog import ChangeListener
+from backend.services.prompt_query import PromptFilter, PromptListPage
+from backend.services.search_scoring import SearchPage, SearchProgress
 
 
 class PromptServiceProtocol(Protocol):
     """提示词服务协议"""
-    async def list_prompts(self) -> List[Prompt]: ...
-    async def read_prompt(self, title: str) -> Optional[Prompt]: ...
-    async def save_prompt(self, prompt_data: Dict[str, Any]) -> Prompt: ...
-    async def update_prompt(self, title: str, update_data: Dict[str, Any]) -> Optional[Prompt]: ...
+    async def list_prompts(self, include_content: bool = True) -> List[PromptRecord]: ...
+    async def read_prompt(self, title: str) -> Optional[PromptRecord]: ...
+    async def read_prompts(self, titles: List[str]) -> Dict[str, PromptRecord]: ...
+    async def save_prompt(self, prompt_data: Dict[str, Any]) -> PromptRecord: ...
+    async def update_prompt(self, title: str, update_data: Dict[str, Any]) -> Optional[PromptRecord]: ...
     async def delete_prompt(self, title: str) -> bool: ...
-    async def search_prompts(self, query: str, search_in: List[str]) -> List[Prompt]: ...
+    async def search_prompts(self, query: str, search_in: List[str], ranking: str = "priority") -> List[PromptRecord]: ...
+    async def search_prompts_page(
+        self,
+        query: str,
+        search_in: List[str],
+        ranking: str = "priority",
+        limit: Optional[int] = None,
+        offset: int = 0,
+        enabled_only: bool = False,
+    ) -> SearchPage: ...
+    async def list_prompts_page(
+        self,
+        after: Optional[str],
+        limit: int,
+        enabled_only: bool = False,
+        tags: Optional[List[str]] = None,
+        include_content: bool = True,
+    ) -> List[Tuple[str, PromptRecord]]: ...
+    async def query_prompts(
+        self,
+        filters: PromptFilter,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        include_content: bool = True,
+    ) -> PromptListPage: ...
+    def search_prompts_chunks(
+        self,
+        query: str,
+        search_in: List[str],
+        ranking: str = "priority",
+        limit: Optional[int] = None,
+        enabled_only: bool = False,
+        chunk_size: int = settings.SEARCH_CHUNK_SIZE,
+    ) -> AsyncIterator[SearchProgress]: ...
+    async def get_catalog_version(self) -> Optional[int]: ...
+    def subscribe_changes(self, listener: ChangeListener) -> None: ...
+    async def increment_usage(self, title: str, delta: int = 1) -> Optional[int]: ...
+    async def increment_usage_bulk(self, deltas: Dict[str, int]) -> Dict[str, int]: ...
 
 
 class UserServiceProtocol(Protocol):
@@ -30,8 +72,9 @@ class TagServiceProtocol(Protocol):
     async def add_tag(self, tag_name: str) -> str: ...
 
 
+@lru_cache(maxsize=None)
 def get_prompt_service() -> PromptServiceProtocol:
-    """获取提示词服务实例"""
+    """获取进程内共享的提示词服务实例（后端API与同进程的MCP服务共用）"""
     if settings.USE_DATABASE:
         from backend.services.db_service import DatabaseService
         return DatabaseService()
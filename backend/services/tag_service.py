@@ -1,7 +1,9 @@
 import asyncio
 import json
 from pathlib import Path
-from typing import List, Set
+from typing import List, Optional, Set
+
+from backend.utils.file_utils import FileSignature, file_lock, file_signature, write_json_atomic
 
 # Path to the tags.json file
 TAGS_FILE_PATH = Path(__file__).parent.parent / "data" / "tags.json"
@@ -16,28 +18,39 @@ if not TAGS_FILE_PATH.exists():
 # Lock for file operations
 _file_lock = asyncio.Lock()
 
+# 按文件签名缓存：多个worker进程共用tags.json，其他进程写入后签名变化即重新读取
+_tags_cache: Set[str] = set()
+_tags_signature: Optional[FileSignature] = None
+
+
+def _read_tags() -> Set[str]:
+    """Reads the set of tags from the JSON file (cached by file signature). Caller holds _file_lock."""
+    global _tags_cache, _tags_signature
+    signature = file_signature(TAGS_FILE_PATH)
+    if signature is None or signature[1] == 0:
+        return set()
+    if signature == _tags_signature:
+        return set(_tags_cache)
+    with open(TAGS_FILE_PATH, "r", encoding="utf-8") as f:
+        try:
+            tags_set = set(json.load(f))
+        except json.JSONDecodeError:
+            return set()
+    _tags_cache, _tags_signature = tags_set, signature
+    return set(tags_set)
+
+
+def _write_tags(tags_set: Set[str]) -> None:
+    """Saves the set of tags to the JSON file as a sorted list. Caller holds _file_lock."""
+    sorted_tags_list = sorted(list(tags_set), key=str.lower)
+    # 原子替换，其他进程不会读到写了一半的文件
+    write_json_atomic(TAGS_FILE_PATH, sorted_tags_list, ensure_ascii=False, indent=2)
+
 
 async def _load_tags_from_file() -> Set[str]:
     """Loads the set of tags from the JSON file."""
     async with _file_lock:
-        if not TAGS_FILE_PATH.exists() or TAGS_FILE_PATH.stat().st_size == 0:
-            return set()
-        # Use await with aiofiles for async file operations if we switch to aiofiles
-        # For now, keeping synchronous file read for simplicity within this locked section
-        with open(TAGS_FILE_PATH, "r", encoding="utf-8") as f:
-            try:
-                tags_list = json.load(f)
-                return set(tags_list)
-            except json.JSONDecodeError:
-                return set()
-
-
-async def _save_tags_to_file(tags_set: Set[str]) -> None:
-    """Saves the set of tags to the JSON file as a sorted list."""
-    async with _file_lock:
-        sorted_tags_list = sorted(list(tags_set), key=str.lower)
-        with open(TAGS_FILE_PATH, "w", encoding="utf-8") as f:
-            json.dump(sorted_tags_list, f, ensure_ascii=False, indent=2)
+        return _read_tags()
 
 
 async def get_all_tags() -> List[str]:
@@ -57,15 +70,18 @@ async def add_tag(tag_name: str) -> str:
     if not stripped_tag:
         raise ValueError("Tag name cannot be empty.")
 
-    current_tags_set = await _load_tags_from_file()
-    
-    # Case-insensitive check for existence
-    for existing_tag in current_tags_set:
-        if existing_tag.lower() == stripped_tag.lower():
-            return existing_tag # Return existing tag (with its original casing)
+    # 重新读取到写入之间持有跨进程锁：并发添加标签的worker不会互相覆盖
+    async with _file_lock:
+        with file_lock(TAGS_FILE_PATH):
+            current_tags_set = _read_tags()
 
-    current_tags_set.add(stripped_tag)  # Add with original casing
-    await _save_tags_to_file(current_tags_set)
+            # Case-insensitive check for existence
+            for existing_tag in current_tags_set:
+                if existing_tag.lower() == stripped_tag.lower():
+                    return existing_tag # Return existing tag (with its original casing)
+
+            current_tags_set.add(stripped_tag)  # Add with original casing
+            _write_tags(current_tags_set)
     return stripped_tag
 
 
@@ -91,25 +107,29 @@ async def sync_tags_from_prompts() -> List[str]:
         print("No tags found in YAML files to sync.")
         return await get_all_tags()
 
-    current_global_tags_set = await _load_tags_from_file()
-    updated_set = current_global_tags_set.copy()
-    newly_added_count = 0
-
-    for tag_from_prompt in tags_from_yaml:
-        # add_tag function already handles case-insensitivity and adds if new
-        # We can call it directly, or replicate its logic for slightly more control here
-        original_tag_to_add = tag_from_prompt # Keep original casing from YAML
-        tag_exists = False
-        for existing_global_tag in updated_set:
-            if existing_global_tag.lower() == original_tag_to_add.lower():
-                tag_exists = True
-                break
-        if not tag_exists:
-            updated_set.add(original_tag_to_add)
-            newly_added_count += 1
-            
+    # 与add_tag相同，读取-合并-写入期间持有跨进程锁
+    async with _file_lock:
+        with file_lock(TAGS_FILE_PATH):
+            updated_set = _read_tags()
+            newly_added_count = 0
+
+            for tag_from_prompt in tags_from_yaml:
+                # add_tag function already handles case-insensitivity and adds if new
+                # We can call it directly, or replicate its logic for slightly more control here
+                original_tag_to_add = tag_from_prompt # Keep original casing from YAML
+                tag_exists = False
+                for existing_global_tag in updated_set:
+                    if existing_global_tag.lower() == original_tag_to_add.lower():
+                        tag_exists = True
+                        break
+                if not tag_exists:
+                    updated_set.add(original_tag_to_add)
+                    newly_added_count += 1
+
+            if newly_added_count > 0:
+                _write_tags(updated_set)
+
     if newly_added_count > 0:
-        await _save_tags_to_file(updated_set)
         print(f"Synced {newly_added_count} new tag(s) to tags.json from prompt YAML files.")
     else:
         print("No new tags from prompt YAML files to sync to tags.json; all existing YAML tags are already present.")
@@ -0,0 +1,117 @@
+"""
+进程内使用次数记录器 - 非阻塞入队，后台任务按标题合并后批量写入存储
+"""
+import asyncio
+import logging
+from collections import Counter
+from typing import Optional
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UsageRecorder:
+    """记录prompt使用事件。
+
+    record() 只做一次 put_nowait，不等待任何IO；后台任务把事件按标题合并，
+    达到时间间隔或数量阈值时通过 increment_usage_bulk 一次性写入增量。
+    """
+
+    def __init__(
+        self,
+        storage_service,
+        flush_interval: float = settings.USAGE_FLUSH_INTERVAL,
+        flush_threshold: int = settings.USAGE_FLUSH_THRESHOLD,
+        max_queue: int = settings.USAGE_QUEUE_MAX,
+    ):
+        self.storage_service = storage_service
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._pending: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, title: str, delta: int = 1) -> None:
+        """记录一次使用（不阻塞；队列满时丢弃并计数）"""
+        try:
+            self._queue.put_nowait((title, delta))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Usage queue full, dropped usage event for prompt: {title}")
+            return
+        if self._task is None or self._task.done():
+            self.start()
+
+    def start(self) -> asyncio.Task:
+        """启动后台合并任务（幂等）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="usage-recorder")
+        return self._task
+
+    async def stop(self) -> None:
+        """停止后台任务并写入剩余的增量"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._drain_queue()
+        await self.flush()
+
+    async def flush(self) -> None:
+        """把已合并的增量写入存储"""
+        if not self._pending:
+            return
+        deltas = dict(self._pending)
+        self._pending.clear()
+        try:
+            await self.storage_service.increment_usage_bulk(deltas)
+            logger.info(f"Flushed usage counts for {len(deltas)} prompt(s)")
+        except Exception as e:
+            logger.error(f"Error flushing usage counts: {e}")
+            # 写入失败时保留增量，下次再试
+            self._pending.update(deltas)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            title, delta = await self._queue.get()
+            self._pending[title] += delta
+            deadline = loop.time() + self.flush_interval
+            # 在间隔内持续合并，数量达到阈值时提前写入
+            while sum(self._pending.values()) < self.flush_threshold:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    title, delta = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                self._pending[title] += delta
+            self._drain_queue()
+            await self.flush()
+
+    def _drain_queue(self) -> None:
+        while True:
+            try:
+                title, delta = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            self._pending[title] += delta
+
+
+_usage_recorder: Optional[UsageRecorder] = None
+
+
+def get_usage_recorder() -> UsageRecorder:
+    """获取进程级使用次数记录器"""
+    global _usage_recorder
+    if _usage_recorder is None:
+        from backend.services.service_factory import get_prompt_service
+
+        _usage_recorder = UsageRecorder(get_prompt_service())
+    return _usage_recorder
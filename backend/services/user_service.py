@@ -4,6 +4,7 @@ from pathlib import Path
 from typing import Dict, List, Optional, Union
 
 from backend.models import UserCreate, UserInDB
+from backend.utils.file_utils import FileSignature, file_lock, file_signature, write_json_atomic
 from backend.utils.security import get_password_hash
 
 DATA_DIR = Path(__file__).parent.parent / "data"
@@ -15,11 +16,14 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 # In-memory cache of users to reduce file I/O, and an ID counter
 _users_cache: Dict[str, UserInDB] = {}
 _current_id_counter: int = 0
+# 缓存对应的users.json签名；其他worker进程写入后签名变化，下次访问时重新加载
+_users_signature: Optional[FileSignature] = None
 
 
 def _load_users_from_file() -> None:
-    global _users_cache, _current_id_counter
-    if not USERS_FILE.exists():
+    global _users_cache, _current_id_counter, _users_signature
+    _users_signature = file_signature(USERS_FILE)
+    if _users_signature is None:
         _users_cache = {}
         _current_id_counter = 0
         _save_users_to_file()  # Create the file with an empty list/dict
@@ -39,15 +43,16 @@ def _load_users_from_file() -> None:
 
 
 def _save_users_to_file() -> None:
+    global _users_signature
     try:
         # Convert UserInDB objects to dictionaries for JSON serialization
         serializable_users = [user.model_dump() for user in _users_cache.values()]
-        with open(USERS_FILE, "w") as f:
-            json.dump(
-                {"users": serializable_users, "next_id": _current_id_counter},
-                f,
-                indent=4,
-            )
+        write_json_atomic(
+            USERS_FILE,
+            {"users": serializable_users, "next_id": _current_id_counter},
+            indent=4,
+        )
+        _users_signature = file_signature(USERS_FILE)
     except IOError as e:
         # Handle file writing errors (e.g., log them)
         print(f"Error saving users file: {e}")
@@ -57,7 +62,14 @@ def _save_users_to_file() -> None:
 _load_users_from_file()
 
 
+def _reload_if_changed() -> None:
+    """users.json被其他进程修改过时重新加载缓存"""
+    if file_signature(USERS_FILE) != _users_signature:
+        _load_users_from_file()
+
+
 async def get_user_by_username(username: str) -> Optional[UserInDB]:
+    _reload_if_changed()
     return _users_cache.get(username)
 
 
@@ -67,16 +79,22 @@ async def create_user_in_db(user_data: UserCreate) -> Optional[UserInDB]:
         return None  # User already exists
 
     hashed_password = get_password_hash(user_data.password)
-    _current_id_counter += 1
-    new_user = UserInDB(
-        id=_current_id_counter,
-        username=user_data.username,
-        hashed_password=hashed_password,
-    )
-    _users_cache[new_user.username] = new_user
-    _save_users_to_file()
+    # 重新加载到写入之间持有跨进程锁：并发创建用户的worker不会互相覆盖或重复使用next_id
+    with file_lock(USERS_FILE):
+        _reload_if_changed()
+        if user_data.username in _users_cache:
+            return None
+        _current_id_counter += 1
+        new_user = UserInDB(
+            id=_current_id_counter,
+            username=user_data.username,
+            hashed_password=hashed_password,
+        )
+        _users_cache[new_user.username] = new_user
+        _save_users_to_file()
     return new_user
 
 
 async def get_all_users() -> List[UserInDB]:  # Mainly for debugging/admin
+    _reload_if_changed()
     return list(_users_cache.values())
@@ -0,0 +1,58 @@
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持多worker共享，只在进程内生效
+    fcntl = None
+
+# (st_ino, st_size, st_mtime_ns)：文件被替换或修改后至少有一项变化
+FileSignature = Tuple[int, int, int]
+
+
+def file_signature(path: Path) -> Optional[FileSignature]:
+    """文件签名，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    """先写同目录下的临时文件再替换，其他进程只会看到完整的旧文件或新文件"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_json_atomic(path: Path, data: Any, **dump_kwargs: Any) -> None:
+    """原子写入JSON文件"""
+    write_bytes_atomic(path, json.dumps(data, **dump_kwargs).encode("utf-8"))
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """跨进程互斥：持有 <path>.lock 上的排他flock，用于保护对path的读取-修改-写入"""
+    if fcntl is None:
+        yield
+        return
+    with open(path.with_name(path.name + ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,128 @@
+"""
+Prompt目录变更推送 - 将存储层的变更事件合并后通过 GET /mcp 的SSE流通知客户端
+
+文件存储模式下变更来自PromptCatalog（目录监听器与本进程写入）；数据库模式下来自本进程写入，
+其他进程的写入通过轮询目录版本号发现。
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set
+
+from backend.config import settings
+from backend.models import PromptRecord
+from backend.services.prompt_catalog import ChangeType, PromptChange
+
+logger = logging.getLogger(__name__)
+
+# 自定义通知方法：params为 {"version": 目录版本号, "changed": [标题], "removed": [标题]}
+CATALOG_CHANGED_METHOD = "notifications/prompts/catalog_changed"
+
+
+class CatalogChangeNotifier:
+    """合并短时间内的目录变更，按批发送一条通知"""
+
+    def __init__(
+        self,
+        storage_service,
+        notify: Callable[[str, Dict[str, Any]], None],
+        debounce: float = settings.MCP_CHANGE_NOTIFY_DEBOUNCE,
+        poll_interval: float = settings.MCP_CATALOG_POLL_INTERVAL,
+    ):
+        self.storage_service = storage_service
+        self.notify = notify
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.sent = 0
+        self._changed: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._last_version: Optional[int] = None
+        self._last_updated_at: Optional[datetime] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """订阅存储层变更；数据库模式下同时启动版本号轮询"""
+        # 先完成基线加载再订阅，避免把首次扫描当作变更推送
+        self._last_version = await self.storage_service.get_catalog_version()
+        self.storage_service.subscribe_changes(self.on_change)
+        if settings.USE_DATABASE and self.poll_interval > 0:
+            self._last_updated_at = await self.storage_service.get_latest_updated_at()
+            self._poll_task = asyncio.create_task(self._poll_loop(), name="catalog-change-poller")
+
+    async def stop(self) -> None:
+        for task in (self._flush_task, self._poll_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flush_task = None
+        self._poll_task = None
+
+    def on_change(self, change: PromptChange, prompt: Optional[PromptRecord]) -> None:
+        """存储层变更监听器"""
+        if change.type == ChangeType.RENAMED and change.old_title_stem:
+            self._changed.discard(change.old_title_stem)
+            self._removed.add(change.old_title_stem)
+        title = change.title_stem  # 文件模式下为文件名，即get_prompt使用的标题
+        if change.type == ChangeType.DELETED:
+            self._changed.discard(title)
+            self._removed.add(title)
+        else:
+            self._removed.discard(title)
+            self._changed.add(title)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        """发送一条合并后的变更通知"""
+        if not self._changed and not self._removed:
+            return
+        changed, removed = sorted(self._changed), sorted(self._removed)
+        self._changed.clear()
+        self._removed.clear()
+        version = await self.storage_service.get_catalog_version()
+        if version is not None:
+            self._last_version = version
+        self.notify(CATALOG_CHANGED_METHOD, {"version": version, "changed": changed, "removed": removed})
+        self.sent += 1
+        logger.info(f"Notified catalog change (version {version}): {len(changed)} changed, {len(removed)} removed")
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.debounce)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error sending catalog change notification: {e}")
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._poll_once()
+            except Exception as e:
+                logger.error(f"Error polling catalog version: {e}")
+
+    async def _poll_once(self) -> None:
+        if self._changed or self._removed:
+            return  # 本进程的写入尚未发出，由flush一并报告
+        version = await self.storage_service.get_catalog_version()
+        if version is None or version == self._last_version:
+            return
+        # 版本号变化但本进程没有对应写入：其他进程修改了目录。
+        # 按更新时间找出变化的标题（可能包含已报告过的本进程写入，重复无害）；
+        # 删除无法从表中得知，只体现在版本号上。
+        updated = await self.storage_service.get_updated_titles(self._last_updated_at)
+        if updated:
+            self._last_updated_at = updated[-1][1]
+        self._last_version = version
+        self.notify(
+            CATALOG_CHANGED_METHOD,
+            {"version": version, "changed": sorted({title for title, _ in updated}), "removed": []},
+        )
+        self.sent += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self._last_version, "sent": self.sent}
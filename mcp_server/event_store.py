@@ -0,0 +1,120 @@
+"""
+GET /mcp 的SSE事件存储 - 每个会话一个有界环形缓冲区，断线重连时按Last-Event-ID补发
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from mcp_server.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# (事件id, JSON-RPC消息)；无会话的订阅者收到的事件id为None
+StoredEvent = Tuple[Optional[int], Dict[str, Any]]
+
+
+class EventSubscriber:
+    """一条打开的GET SSE连接。
+
+    队列写满说明客户端消费过慢：丢弃排队的事件并放入结束标记，连接随之关闭，
+    客户端带Last-Event-ID重连后从缓冲区补发。
+    """
+
+    def __init__(self, session_id: Optional[str], max_pending: int):
+        self.session_id = session_id
+        self.queue: "asyncio.Queue[Optional[StoredEvent]]" = asyncio.Queue(maxsize=max_pending + 1)
+        self.max_pending = max_pending
+        self.overflowed = False
+
+    def offer(self, event: StoredEvent) -> None:
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= self.max_pending:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(event)
+
+
+class SessionEventStore:
+    """按会话保存最近的服务端通知并分发给在线订阅者。
+
+    只有打开过GET流的会话才会分配缓冲区，每个缓冲区最多保留 max_events 条，
+    会话被删除或淘汰时由 drop() 释放。事件id由 id_allocator 按会话单调分配。
+    """
+
+    def __init__(self, max_events: int, id_allocator: Callable[[str], Optional[int]]):
+        self.max_events = max_events
+        self._allocate_id = id_allocator
+        self._buffers: Dict[str, Deque[StoredEvent]] = {}
+        self._subscribers: Dict[Optional[str], Set[EventSubscriber]] = {}
+        self.published = 0
+
+    def subscribe(self, session_id: Optional[str]) -> EventSubscriber:
+        """注册一条SSE连接；有会话时同时为其建立缓冲区"""
+        if session_id is not None and session_id not in self._buffers:
+            self._buffers[session_id] = deque(maxlen=self.max_events)
+        subscriber = EventSubscriber(session_id, self.max_events)
+        self._subscribers.setdefault(session_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: EventSubscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.session_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.session_id]
+
+    def replay(self, session_id: str, last_event_id: int) -> List[StoredEvent]:
+        """返回会话缓冲区中id大于last_event_id的事件"""
+        buffer = self._buffers.get(session_id)
+        if not buffer:
+            return []
+        return [event for event in buffer if event[0] > last_event_id]
+
+    def publish(self, session_id: str, message: Dict[str, Any]) -> Optional[int]:
+        """向单个会话发送通知，返回事件id；会话不存在时返回None"""
+        event_id = self._allocate_id(session_id)
+        if event_id is None:
+            self.drop(session_id)
+            return None
+        event = (event_id, message)
+        self._buffers.setdefault(session_id, deque(maxlen=self.max_events)).append(event)
+        for subscriber in self._subscribers.get(session_id, ()):
+            subscriber.offer(event)
+        self.published += 1
+        return event_id
+
+    def broadcast(self, message: Dict[str, Any]) -> None:
+        """向所有打开过GET流的会话以及无会话的在线连接发送通知"""
+        for session_id in list(self._buffers):
+            self.publish(session_id, message)
+        for subscriber in self._subscribers.get(None, ()):
+            subscriber.offer((None, message))
+
+    def drop(self, session_id: str, reason: str = "deleted") -> None:
+        """释放会话的缓冲区并关闭其在线连接"""
+        self._buffers.pop(session_id, None)
+        for subscriber in self._subscribers.pop(session_id, ()):
+            subscriber.queue.put_nowait(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered_sessions": len(self._buffers),
+            "buffered_events": sum(len(buffer) for buffer in self._buffers.values()),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+        }
+
+
+def format_sse_event(event: StoredEvent) -> Dict[str, Any]:
+    """转换为EventSourceResponse使用的事件字典"""
+    event_id, message = event
+    sse_event = {"event": "message", "data": dumps(message)}
+    if event_id is not None:
+        sse_event["id"] = str(event_id)
+    return sse_event
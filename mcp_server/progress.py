@@ -0,0 +1,53 @@
+"""
+请求级进度通知 - 请求通过SSE响应时，处理器可在最终结果之前向同一条流发送通知
+
+传输层用 bind_request_notifier 为当前请求绑定发送函数（contextvar，随请求任务传递）；
+工具处理器用 get_progress_reporter 取得进度报告器，客户端未提供progressToken或
+响应不是SSE流时返回None。
+"""
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from mcp_server.protocol import MCPMessage
+
+_request_notifier: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar(
+    "mcp_request_notifier", default=None
+)
+
+# 搜索中间结果的自定义通知方法
+PARTIAL_RESULTS_METHOD = "notifications/prompts/search_partial"
+
+
+def bind_request_notifier(send: Callable[[Dict[str, Any]], None]) -> None:
+    """为当前请求（及其派生任务）绑定通知发送函数"""
+    _request_notifier.set(send)
+
+
+class ProgressReporter:
+    """按MCP progressToken发送 notifications/progress 及中间结果"""
+
+    def __init__(self, token: Any, send: Callable[[Dict[str, Any]], None]):
+        self.token = token
+        self._send = send
+
+    def progress(self, progress: float, total: Optional[float] = None, message: Optional[str] = None) -> None:
+        params: Dict[str, Any] = {"progressToken": self.token, "progress": progress}
+        if total is not None:
+            params["total"] = total
+        if message:
+            params["message"] = message
+        self._send(MCPMessage(method="notifications/progress", params=params).to_dict())
+
+    def partial(self, params: Dict[str, Any]) -> None:
+        self._send(MCPMessage(method=PARTIAL_RESULTS_METHOD, params={"progressToken": self.token, **params}).to_dict())
+
+
+def get_progress_reporter(params: Dict[str, Any]) -> Optional[ProgressReporter]:
+    """从请求参数的 _meta.progressToken 构造进度报告器"""
+    send = _request_notifier.get()
+    if send is None:
+        return None
+    token = (params.get("_meta") or {}).get("progressToken")
+    if token is None:
+        return None
+    return ProgressReporter(token, send)
@@ -1,5 +1,6 @@
+import asyncio
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Hashable, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
@@ -52,6 +53,9 @@ class MCPProtocol:
 
     def __init__(self):
         self.handlers = {}
+        # 正在执行的请求：(scope, 请求id) -> 任务，scope通常为session id
+        self.in_flight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self.cancelled = 0
         # 注册内置方法
         self.register_handler("initialize", self._handle_initialize)
         self.register_handler("initialized", self._handle_initialized)
@@ -62,8 +66,26 @@ class MCPProtocol:
         self.handlers[method] = handler
         logger.info(f"Registered handler for method: {method}")
 
-    async def handle_message(self, message: Dict[str, Any]) -> Optional[MCPMessage]:
-        """处理MCP消息"""
+    def cancel(self, scope: Optional[str], request_id: Any, reason: Optional[str] = None) -> bool:
+        """取消正在执行的请求，返回是否找到该请求"""
+        if scope is None:
+            return False
+        try:
+            task = self.in_flight.get((scope, request_id))
+        except TypeError:
+            return False  # 不可哈希的id不可能是正在执行的请求
+        if task is None or task.done():
+            return False
+        logger.info(f"Cancelling request {request_id}" + (f": {reason}" if reason else ""))
+        task.cancel()
+        self.cancelled += 1
+        return True
+
+    async def handle_message(self, message: Dict[str, Any], scope: Optional[str] = None) -> Optional[MCPMessage]:
+        """处理MCP消息；scope用于区分不同会话中相同的请求id。
+
+        没有scope（无会话的HTTP请求）时无法确定取消通知来自哪个客户端，请求不可取消。
+        """
         # 验证JSON-RPC格式
         if message.get("jsonrpc") != "2.0":
             return MCPMessage(
@@ -84,28 +106,63 @@ class MCPProtocol:
                 },
             )
 
+        message_id = message.get("id")
+
+        if method == "notifications/cancelled":
+            params = message.get("params") or {}
+            self.cancel(scope, params.get("requestId"), params.get("reason"))
+            return None
+
         if method not in self.handlers:
+            if message_id is None:
+                return None  # 不认识的通知直接忽略，通知不需要响应
             logger.warning(f"Method not found: {method}")
             return MCPMessage(
                 id=message.get("id"),
                 error={"code": -32601, "message": f"Method not found: {method}"},
             )
 
+        params = message.get("params", {})
+        if message_id is None:
+            # 通知（没有id）不可取消，也不返回响应
+            try:
+                await self.handlers[method](params)
+            except Exception as e:
+                logger.error(f"Error handling notification {method}: {e}")
+            return None
+
+        # 请求在独立任务中执行，收到notifications/cancelled时可单独取消
+        task = asyncio.ensure_future(self.handlers[method](params))
+        key = self._in_flight_key(scope, message_id)
+        if key is not None:
+            self.in_flight[key] = task
         try:
-            params = message.get("params", {})
-            result = await self.handlers[method](params)
-
-            # 如果是通知（没有id），不返回响应
-            if message.get("id") is None:
-                return None
-
-            return MCPMessage(id=message.get("id"), result=result)
+            result = await task
+            return MCPMessage(id=message_id, result=result)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise  # 外层被取消（如客户端断开），await时已一并取消了处理任务
+            # 被客户端取消的请求不返回响应
+            return None
         except Exception as e:
             logger.error(f"Error handling method {method}: {e}")
             return MCPMessage(
-                id=message.get("id"),
+                id=message_id,
                 error={"code": -32603, "message": f"Internal error: {str(e)}"},
             )
+        finally:
+            if key is not None and self.in_flight.get(key) is task:
+                del self.in_flight[key]
+
+    @staticmethod
+    def _in_flight_key(scope: Optional[str], message_id: Any) -> Optional[Tuple[str, Hashable]]:
+        if scope is None:
+            return None  # 不同的无会话客户端可能使用相同的id，不能互相取消
+        try:
+            hash(message_id)
+        except TypeError:
+            return None
+        return (scope, message_id)
 
     async def _handle_initialize(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """处理初始化请求"""
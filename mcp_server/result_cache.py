@@ -0,0 +1,77 @@
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """MCP工具结果的LRU缓存。
+
+    键包含目录版本号，目录版本变化后旧条目不会再被命中；观察到新版本时整体清空，
+    立即释放内存。条目数与估算字节数（结果的JSON长度）都有上限。
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """查找缓存结果，未命中返回None"""
+        self._observe_version(version)
+        entry = self._entries.get((version, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((version, key))
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, version: int, value: Any) -> None:
+        """写入缓存结果，超出上限时按LRU淘汰"""
+        self._observe_version(version)
+        size = len(json.dumps(value, ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+        full_key = (version, key)
+        old = self._entries.pop(full_key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[full_key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _observe_version(self, version: int) -> None:
+        if version != self._version:
+            if self._entries:
+                logger.debug(f"Catalog version changed {self._version} -> {version}, clearing result cache")
+            self.clear()
+            self._version = version
@@ -1,76 +1,129 @@
-from urllib.parse import quote
-from typing import List, Dict, Any, Optional
+import base64
+import json
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
 from backend.config import settings
+from backend.services.catalog_snapshot import CatalogSnapshotPublisher, SnapshotPromptService, get_snapshot_reader
+from backend.services.service_factory import get_prompt_service
+from backend.services.search_scoring import RANKING_MODES, RANKING_PRIORITY, SearchPage
+from backend.services.usage_recorder import get_usage_recorder
+from mcp_server.progress import ProgressReporter
+from mcp_server.result_cache import ResultCache
+from mcp_server.serialization import JSONFragment, PromptFragmentCache
 import logging
-import httpx
 
 logger = logging.getLogger(__name__)
 
+# list_prompts_by_tag 可投影的字段
+PROMPT_FIELDS = ("title", "content", "tags", "remark")
+PROMPT_DETAIL_FIELDS = PROMPT_FIELDS + ("created_at", "updated_at")
+
 
 class SearchService:
     def __init__(self):
-        if settings.USE_DATABASE:
-            from backend.services.db_service import DatabaseService
-            self.storage_service = DatabaseService()
-        else:
-            from backend.services.file_service import FileService
-            self.storage_service = FileService()
-
-    async def search_prompts(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """MCP搜索接口"""
+        self.storage_service = get_prompt_service()
+        self.snapshot_publisher = None
+        reader = get_snapshot_reader()
+        if reader is not None:
+            # 多worker共享快照：读取走mmap文件，由持有锁的进程负责写入
+            self.snapshot_publisher = CatalogSnapshotPublisher(self.storage_service, reader)
+            self.storage_service = SnapshotPromptService(reader, self.storage_service)
+        self.usage_recorder = get_usage_recorder()
+        self.result_cache = ResultCache(
+            max_entries=settings.MCP_RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=settings.MCP_RESULT_CACHE_MAX_BYTES,
+        )
+        self.fragments = PromptFragmentCache(settings.MCP_FRAGMENT_CACHE_MAX_ENTRIES)
+
+    async def _cached(self, key: Tuple, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """按 (规范化的工具参数, 目录版本) 缓存结果，目录有任何变更后旧结果不再命中"""
+        if not self.result_cache.enabled:
+            return await compute()
+        version = await self.storage_service.get_catalog_version()
+        if version is None:
+            return await compute()
+        cached = self.result_cache.get(key, version)
+        if cached is not None:
+            return cached
+        result = await compute()
+        self.result_cache.put(key, version, result)
+        return result
+
+    async def search_prompts(
+        self, params: Dict[str, Any], reporter: Optional[ProgressReporter] = None
+    ) -> List[JSONFragment]:
+        """MCP搜索接口；提供reporter时分块搜索，边搜索边推送进度和中间结果"""
         query = params.get("query", "")
         search_in = params.get("search_in", ["title", "tags", "content"])
         limit = params.get("limit", 20)
+        ranking = params.get("ranking", RANKING_PRIORITY)
+        if ranking not in RANKING_MODES:
+            raise ValueError(f"Unknown ranking mode: {ranking}")
 
-        logger.info(
-            f"Searching prompts: query='{query}', search_in={search_in}, limit={limit}"
+        # 搜索不区分大小写、忽略首尾空白，search_in与顺序无关
+        key = ("search_prompts", query.strip().lower(), tuple(sorted(set(search_in))), limit, ranking)
+
+        if reporter is not None:
+            return await self._cached(
+                key, lambda: self._search_prompts_progressively(query, search_in, limit, ranking, reporter)
+            )
+        return await self._cached(key, lambda: self._search_prompts(query, search_in, limit, ranking))
+
+    async def _search_prompts(
+        self, query: str, search_in: List[str], limit: int, ranking: str
+    ) -> List[JSONFragment]:
+        logger.debug(
+            f"Searching prompts: query='{query}', search_in={search_in}, limit={limit}, ranking={ranking}"
         )
 
-        # 只搜索启用的prompts
-        all_prompts = await self.storage_service.search_prompts(query, search_in)
-        enabled_prompts = [p for p in all_prompts if p.status == "enabled"]
+        # 只搜索启用的prompts，top-k在存储层完成
+        page = await self.storage_service.search_prompts_page(
+            query, search_in, ranking, limit=limit, enabled_only=True
+        )
 
-        # 转换为MCP格式
-        results = []
-        for prompt in enabled_prompts[:limit]:
-            results.append(
-                {
-                    "title": prompt.title,
-                    "content": prompt.content,
-                    "tags": prompt.tags,
-                    "remark": prompt.remark,
-                    "score": self._calculate_score(prompt, query, search_in),
-                }
-            )
+        results = self._format_hits(page, ranking)
+        logger.debug(f"Found {page.total} prompts, returning {len(results)}")
+        return results
 
-        logger.info(f"Found {len(results)} prompts")
+    async def _search_prompts_progressively(
+        self, query: str, search_in: List[str], limit: int, ranking: str, reporter: ProgressReporter
+    ) -> List[JSONFragment]:
+        page = SearchPage([], 0)
+        last_titles = None
+        async for progress in self.storage_service.search_prompts_chunks(
+            query, search_in, ranking, limit=limit, enabled_only=True
+        ):
+            page = progress.page
+            reporter.progress(progress.scanned, progress.total)
+            # top-k有变化时推送中间结果，最后一块的结果由最终响应返回
+            titles = [prompt.title for _, prompt in page.hits]
+            if progress.scanned < progress.total and titles != last_titles:
+                reporter.partial(
+                    {"results": self._format_hits(page, ranking), "scanned": progress.scanned, "total": progress.total}
+                )
+                last_titles = titles
+        return self._format_hits(page, ranking)
+
+    def _format_hits(self, page: SearchPage, ranking: str) -> List[JSONFragment]:
+        # 转换为MCP格式，prompt部分复用缓存的JSON片段，只拼接得分
+        results = []
+        for score, prompt in page.hits:
+            score_value = int(score) if ranking == RANKING_PRIORITY else round(score, 4)
+            results.append(self.fragments.fragment(prompt, PROMPT_FIELDS, ("score", score_value)))
         return results
 
-    def _calculate_score(self, prompt, query: str, search_in: List[str]) -> int:
-        """计算搜索得分"""
-        score = 0
-        query_lower = query.lower()
-
-        if "title" in search_in and query_lower in prompt.title.lower():
-            score = 100
-        elif "tags" in search_in:
-            for tag in prompt.tags:
-                if query_lower in tag.lower():
-                    score = max(score, 50)
-        elif "content" in search_in and query_lower in prompt.content.lower():
-            score = max(score, 10)
-
-        return score
-
-    async def get_prompt_names(self, params: Dict[str, Any]) -> List[str]:
-        """获取所有可用的prompt名称"""
-        all_prompts = await self.storage_service.list_prompts()
-        enabled_prompts = [p for p in all_prompts if p.status == "enabled"]
-        names = [p.title for p in enabled_prompts]
-        logger.info(f"Returning {len(names)} prompt names")
-        return names
-
-    async def get_prompt(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    async def get_prompt_names(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """分页获取可用的prompt名称"""
+        after, page_size = _page_params(params)
+        key = ("get_prompt_names", after, page_size)
+        return await self._cached(key, lambda: self._get_prompt_names(after, page_size))
+
+    async def _get_prompt_names(self, after: Optional[str], page_size: int) -> Dict[str, Any]:
+        rows, next_cursor = await self._page(after, page_size)
+        names = [prompt.title for _, prompt in rows]
+        logger.debug(f"Returning {len(names)} prompt names")
+        return _with_cursor({"names": names}, next_cursor)
+
+    async def get_prompt(self, params: Dict[str, Any]) -> Optional[JSONFragment]:
         """根据标题获取prompt"""
         title = params.get("title")
         if not title:
@@ -80,53 +133,89 @@ class SearchService:
         if not prompt or prompt.status != "enabled":
             return None
 
-        # Increment usage count by calling the backend API
-        try:
-            async with httpx.AsyncClient() as client:
-                prompt_title_encoded = quote(prompt.title)
-                increment_url = f"http://localhost:8010/api/v1/prompts/{prompt_title_encoded}/increment-usage"
-                response = await client.post(increment_url)
-                response.raise_for_status()  # Raise an exception for bad status codes
-                logger.info(f"Successfully incremented usage count for prompt: {prompt.title}")
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Error incrementing usage count for prompt {prompt.title} (HTTP {e.response.status_code}): {e.response.text}")
-        except httpx.RequestError as e:
-            logger.error(f"Request error while incrementing usage count for prompt {prompt.title}: {str(e)}")
-        except Exception as e:
-            logger.error(f"Unexpected error incrementing usage count for prompt {prompt.title}: {str(e)}")
-
-        return {
-            "title": prompt.title,
-            "content": prompt.content,
-            "tags": prompt.tags,
-            "remark": prompt.remark,
-            "created_at": prompt.created_at.isoformat(),
-            "updated_at": prompt.updated_at.isoformat(),
-        }
-
-    async def list_prompts(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """列出所有prompts"""
-        tags_filter = params.get("tags", [])
+        # 使用次数只在进程内入队，由后台任务合并后批量写入存储
+        self.usage_recorder.record(title)
 
-        all_prompts = await self.storage_service.list_prompts()
-        enabled_prompts = [p for p in all_prompts if p.status == "enabled"]
+        return self.fragments.fragment(prompt, PROMPT_DETAIL_FIELDS)
 
-        # 按标签过滤
-        if tags_filter:
-            enabled_prompts = [
-                p for p in enabled_prompts if any(tag in p.tags for tag in tags_filter)
-            ]
+    async def get_prompts(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """根据标题列表批量获取prompt，结果按请求顺序逐项返回，未找到的标题带错误信息"""
+        titles = params.get("titles")
+        if not titles or not isinstance(titles, list):
+            raise ValueError("Titles are required")
+        titles = list(dict.fromkeys(titles))
+        if len(titles) > settings.MCP_PAGE_SIZE_MAX:
+            raise ValueError(f"At most {settings.MCP_PAGE_SIZE_MAX} titles per call")
 
-        # 转换格式
-        results = []
-        for prompt in enabled_prompts:
-            results.append(
-                {
-                    "title": prompt.title,
-                    "content": prompt.content,
-                    "tags": prompt.tags,
-                    "remark": prompt.remark,
-                }
-            )
+        # 一次存储查询取回全部标题
+        prompts = await self.storage_service.read_prompts(titles)
 
+        results = []
+        for title in titles:
+            prompt = prompts.get(title)
+            if not prompt or prompt.status != "enabled":
+                results.append({"title": title, "found": False, "error": "Prompt not found"})
+                continue
+            self.usage_recorder.record(title)
+            results.append({"title": title, "found": True, "prompt": self.fragments.fragment(prompt, PROMPT_DETAIL_FIELDS)})
         return results
+
+    async def list_prompts(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """按标签分页列出prompts"""
+        tags_filter = params.get("tags", [])
+        fields = params.get("fields") or list(PROMPT_FIELDS)
+        unknown = set(fields) - set(PROMPT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        after, page_size = _page_params(params)
+        key = ("list_prompts_by_tag", tuple(sorted(set(tags_filter))), tuple(fields), after, page_size)
+        return await self._cached(key, lambda: self._list_prompts(tags_filter, fields, after, page_size))
+
+    async def _list_prompts(
+        self, tags_filter: List[str], fields: List[str], after: Optional[str], page_size: int
+    ) -> Dict[str, Any]:
+        # 未请求content时只取元数据；请求了content则取完整记录，序列化时不会同步读取文件
+        rows, next_cursor = await self._page(after, page_size, tags_filter, include_content="content" in fields)
+
+        # 只返回请求的字段
+        results = [self.fragments.fragment(prompt, fields) for _, prompt in rows]
+        return _with_cursor({"prompts": results}, next_cursor)
+
+    async def _page(
+        self, after: Optional[str], page_size: int, tags: Optional[List[str]] = None, include_content: bool = False
+    ) -> Tuple[List[Tuple[str, Any]], Optional[str]]:
+        """键集分页：多取一条判断是否还有下一页，游标记录本页最后一条的键"""
+        rows = await self.storage_service.list_prompts_page(
+            after, page_size + 1, enabled_only=True, tags=tags or None, include_content=include_content
+        )
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            return rows, _encode_cursor(rows[-1][0])
+        return rows, None
+
+
+def _encode_cursor(key: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": key}).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _page_params(params: Dict[str, Any]) -> Tuple[Optional[str], int]:
+    """解析cursor与page_size参数"""
+    cursor = params.get("cursor")
+    after = _decode_cursor(cursor) if cursor else None
+    page_size = params.get("page_size", settings.MCP_PAGE_SIZE_DEFAULT)
+    if not isinstance(page_size, int) or page_size < 1:
+        raise ValueError("page_size must be a positive integer")
+    return after, min(page_size, settings.MCP_PAGE_SIZE_MAX)
+
+
+def _with_cursor(result: Dict[str, Any], next_cursor: Optional[str]) -> Dict[str, Any]:
+    if next_cursor:
+        result["nextCursor"] = next_cursor
+    return result
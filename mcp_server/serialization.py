@@ -0,0 +1,117 @@
+"""
+MCP响应序列化 - 紧凑输出，安装了orjson时使用orjson，否则退回标准库json
+
+prompt的JSON片段按 (字段, 字段值) 缓存，内容相同的prompt在不同响应间只序列化一次。
+"""
+import json
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, Iterable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson>=3.9 可直接嵌入已序列化片段，旧版本需要在外层容器上逐层拼接
+_ORJSON_FRAGMENTS = orjson is not None and hasattr(orjson, "Fragment")
+
+
+class JSONFragment:
+    """已序列化的JSON片段，编码时原样嵌入"""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, JSONFragment):
+        return orjson.Fragment(obj.text)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _encode_leaf(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def _encode(obj: Any) -> str:
+    # 只有外层容器需要逐层展开，片段直接拼接
+    if isinstance(obj, JSONFragment):
+        return obj.text
+    if isinstance(obj, dict):
+        return "{" + ",".join(_encode_leaf(str(key)) + ":" + _encode(value) for key, value in obj.items()) + "}"
+    if isinstance(obj, (list, tuple)):
+        return "[" + ",".join(_encode(item) for item in obj) + "]"
+    return _encode_leaf(obj)
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    """序列化为紧凑JSON字符串（非ASCII字符不转义）；pretty为True时缩进输出"""
+    if _ORJSON_FRAGMENTS:
+        text = orjson.dumps(obj, default=_default).decode()
+    else:
+        text = _encode(obj)
+    if pretty:
+        # 片段已是紧凑格式，缩进输出需重新解析（仅在显式开启时使用）
+        return json.dumps(json.loads(text), ensure_ascii=False, indent=2)
+    return text
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    if _ORJSON_FRAGMENTS:
+        return orjson.dumps(obj, default=_default)
+    return _encode(obj).encode("utf-8")
+
+
+def _key_value(value: Any) -> Hashable:
+    return tuple(value) if isinstance(value, list) else value
+
+
+class PromptFragmentCache:
+    """按所选字段的值缓存prompt JSON片段的LRU缓存。
+
+    不用 (标题, 更新时间) 作键：文件模式的更新时间来自mtime，两次写入可能相同，
+    使用次数写回也不改变更新时间。字符串的哈希值缓存在对象上，且缓存中的content
+    通常与目录记录是同一对象，因此比较键的开销很小。
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, JSONFragment]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def fragment(self, prompt: Any, fields: Iterable[str], extra: Optional[Tuple[str, Any]] = None) -> JSONFragment:
+        """prompt指定字段的JSON片段；extra为追加在末尾的 (键, 值)，如搜索得分"""
+        fields = tuple(fields)
+        values = {field: getattr(prompt, field) for field in fields}
+        key = (fields, tuple(_key_value(value) for value in values.values()))
+        cached = self._entries.get(key)
+        if cached is None:
+            self.misses += 1
+            cached = JSONFragment(dumps(values))
+            if self.max_entries > 0:
+                self._entries[key] = cached
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        if extra is None:
+            return cached
+        name, value = extra
+        body = cached.text[:-1]
+        separator = "," if len(body) > 1 else ""
+        return JSONFragment(f"{body}{separator}{dumps(name)}:{dumps(value)}}}")
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -1,4 +1,5 @@
 import asyncio
+import itertools
 import json
 import uuid
 from typing import Dict, Any, Optional, List
@@ -8,7 +9,12 @@ from sse_starlette.sse import EventSourceResponse
 import uvicorn
 from backend.config import settings
 from mcp_server.protocol import MCPProtocol, MCPMessage
-from mcp_server.search_service import SearchService
+from mcp_server.progress import bind_request_notifier
+from mcp_server.change_notifier import CatalogChangeNotifier
+from mcp_server.event_store import SessionEventStore, format_sse_event
+from mcp_server.serialization import dumps, dumps_bytes
+from mcp_server.session_store import SessionSweeper, create_session_store
+from mcp_server.tools import TOOLS, _sample_request_log, register_tools, search_service
 import logging
 
 # 配置日志
@@ -17,171 +23,170 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="MCP Server - Streamable HTTP", version="0.1.0")
 protocol = MCPProtocol()
-search_service = SearchService()
-
-# Session管理（可选）
-sessions: Dict[str, Dict[str, Any]] = {}
-
-# 定义工具列表
-TOOLS = [
-    {
-        "name": "search_prompts",
-        "description": "搜索prompt模板，支持按标题、标签和内容搜索",
-        "inputSchema": {
-            "type": "object",
-            "properties": {
-                "query": {"type": "string", "description": "搜索关键词"},
-                "search_in": {
-                    "type": "array",
-                    "items": {"type": "string"},
-                    "description": "搜索范围：title, tags, content",
-                    "default": ["title", "tags", "content"],
-                },
-                "limit": {
-                    "type": "integer",
-                    "description": "返回结果数量限制",
-                    "default": 20,
-                    "minimum": 1,
-                    "maximum": 100,
-                },
-            },
-            "required": ["query"],
-        },
-    },
-    {
-        "name": "get_prompt_names",
-        "description": "获取所有可用的prompt名称列表",
-        "inputSchema": {"type": "object", "properties": {}, "required": []},
-    },
-    {
-        "name": "get_prompt_by_title",
-        "description": "根据标题获取具体的prompt内容",
-        "inputSchema": {
-            "type": "object",
-            "properties": {"title": {"type": "string", "description": "prompt标题"}},
-            "required": ["title"],
-        },
-    },
-    {
-        "name": "list_prompts_by_tag",
-        "description": "列出指定标签的所有prompts",
-        "inputSchema": {
-            "type": "object",
-            "properties": {
-                "tags": {
-                    "type": "array",
-                    "items": {"type": "string"},
-                    "description": "按标签过滤，留空返回所有prompts",
-                }
-            },
-            "required": [],
-        },
-    },
-]
 
+# Session管理（可选）：容量上限 + 空闲TTL + LRU淘汰
+sessions = create_session_store()
+session_sweeper = SessionSweeper(sessions)
 
-# MCP方法处理器
-async def handle_initialize(params: Dict[str, Any]) -> Dict[str, Any]:
-    """处理初始化请求"""
-    client_info = params.get("clientInfo", {})
-    logger.info(f"Initializing for client: {client_info.get('name', 'unknown')}")
+# GET /mcp 推送的服务端通知，按会话缓冲以支持Last-Event-ID续传
+event_store = SessionEventStore(settings.MCP_EVENT_BUFFER_SIZE, sessions.next_event_id)
+sessions.subscribe(event_store.drop)
+SSE_PING_INTERVAL = 30
 
-    return {
-        "protocolVersion": "2024-11-05",
-        "serverInfo": {"name": "prompt-management-mcp", "version": "1.0.0"},
-        "capabilities": {
-            "tools": {},  # 声明支持工具
-            # 不声明不支持的功能
-        },
-    }
 
+class FastJSONResponse(JSONResponse):
+    """使用 dumps_bytes 渲染的JSON响应"""
 
-async def handle_tools_list(params: Dict[str, Any]) -> Dict[str, Any]:
-    """处理工具列表请求"""
-    return {"tools": TOOLS}
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
 
 
-async def handle_tools_call(params: Dict[str, Any]) -> Any:
-    """处理工具调用请求"""
-    tool_name = params.get("name")
-    tool_args = params.get("arguments", {})
+# 注册处理器
+register_tools(protocol)
 
-    logger.info(f"Tool call: {tool_name} with args: {json.dumps(tool_args)}")
 
-    try:
-        if tool_name == "search_prompts":
-            results = await search_service.search_prompts(tool_args)
-            return {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {"results": results}, ensure_ascii=False, indent=2
-                        ),
-                    }
-                ]
-            }
+@app.on_event("startup")
+async def startup_prompt_watcher():
+    """文件存储模式下监听prompt-template目录，变更增量同步到内存目录"""
+    if settings.USE_DATABASE or search_service.snapshot_publisher is not None:
+        return  # 启用共享快照时只有写入方进程维护目录
+    from backend.services.prompt_catalog import get_prompt_catalog
+    from backend.services.prompt_watcher import start_prompt_watcher
 
-        elif tool_name == "get_prompt_names":
-            names = await search_service.get_prompt_names(tool_args)
-            return {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {"names": names}, ensure_ascii=False, indent=2
-                        ),
-                    }
-                ]
-            }
+    start_prompt_watcher(get_prompt_catalog(settings.PROMPT_TEMPLATE_DIR))
 
-        elif tool_name == "get_prompt_by_title":
-            prompt = await search_service.get_prompt(tool_args)
-            if prompt:
-                return {
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": json.dumps(
-                                {"prompt": prompt}, ensure_ascii=False, indent=2
-                            ),
-                        }
-                    ]
-                }
-            else:
-                return {
-                    "content": [{"type": "text", "text": "Prompt not found"}],
-                    "isError": True,
-                }
-
-        elif tool_name == "list_prompts_by_tag":
-            prompts = await search_service.list_prompts(tool_args)
-            return {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {"prompts": prompts}, ensure_ascii=False, indent=2
-                        ),
-                    }
-                ]
-            }
 
-        else:
-            raise ValueError(f"Unknown tool: {tool_name}")
+@app.on_event("shutdown")
+async def shutdown_prompt_watcher():
+    from backend.services.prompt_watcher import stop_prompt_watchers
 
-    except Exception as e:
-        logger.error(f"Tool execution error: {e}", exc_info=True)
-        return {
-            "content": [{"type": "text", "text": f"Error: {str(e)}"}],
-            "isError": True,
-        }
+    await stop_prompt_watchers()
 
 
-# 注册处理器
-protocol.register_handler("initialize", handle_initialize)
-protocol.register_handler("tools/list", handle_tools_list)
-protocol.register_handler("tools/call", handle_tools_call)
+async def start_background_tasks() -> None:
+    """启动目录变更推送与会话清理。
+
+    独立运行时由startup事件调用；挂载到后端应用时子应用的生命周期事件不会执行，
+    由后端的startup事件调用。
+    """
+    # 共享快照先于变更推送启动，变更推送以快照代数为目录版本
+    if search_service.snapshot_publisher is not None:
+        await search_service.snapshot_publisher.start()
+    # 订阅prompt目录变更，推送给GET /mcp 的SSE连接
+    await change_notifier.start()
+    # 定期清理空闲超时的会话
+    session_sweeper.start()
+
+
+async def stop_background_tasks() -> None:
+    await change_notifier.stop()
+    if search_service.snapshot_publisher is not None:
+        await search_service.snapshot_publisher.stop()
+    await session_sweeper.stop()
+    # 退出前写入尚未落盘的使用次数
+    await search_service.usage_recorder.stop()
+
+
+@app.on_event("startup")
+async def startup_background_tasks():
+    await start_background_tasks()
+
+
+@app.on_event("shutdown")
+async def shutdown_background_tasks():
+    await stop_background_tasks()
+
+
+def notify_clients(method: str, params: Optional[Dict[str, Any]] = None, session_id: Optional[str] = None) -> None:
+    """通过GET /mcp 的SSE流发送服务端通知；不指定session时广播给所有连接"""
+    message = MCPMessage(method=method, params=params).to_dict()
+    if session_id is None:
+        event_store.broadcast(message)
+    else:
+        event_store.publish(session_id, message)
+
+
+change_notifier = CatalogChangeNotifier(search_service.storage_service, notify_clients)
+
+
+def _bounded_dispatcher(session_id: Optional[str]):
+    """返回一个受 MCP_BATCH_CONCURRENCY 限制的单条消息处理函数（每个批次独立计数）"""
+    semaphore = asyncio.Semaphore(max(1, settings.MCP_BATCH_CONCURRENCY))
+
+    async def dispatch(message: Dict[str, Any]) -> Optional[MCPMessage]:
+        async with semaphore:
+            return await protocol.handle_message(message, scope=session_id)
+
+    return dispatch
+
+
+async def _dispatch_concurrently(
+    messages: List[Dict[str, Any]], session_id: Optional[str]
+) -> List[Optional[MCPMessage]]:
+    """并发执行一批JSON-RPC请求，结果按原顺序返回"""
+    if len(messages) == 1:
+        return [await protocol.handle_message(messages[0], scope=session_id)]
+
+    dispatch = _bounded_dispatcher(session_id)
+    return await asyncio.gather(*(dispatch(message) for message in messages))
+
+
+def _next_event_id(session_id: Optional[str], fallback: itertools.count) -> str:
+    """分配SSE事件id：有session时在session内单调递增，便于断线后按Last-Event-ID续传"""
+    event_id = sessions.next_event_id(session_id) if session_id else None
+    if event_id is None:
+        return str(next(fallback))
+    return str(event_id)
+
+
+def _create_session(message: Dict[str, Any]) -> str:
+    session_id = str(uuid.uuid4())
+    sessions.create(session_id, {"client_info": message.get("params", {}).get("clientInfo", {})})
+    logger.info(f"Created new session: {session_id}")
+    return session_id
+
+
+async def _stream_responses(requests: List[Dict[str, Any]], session_id: Optional[str]):
+    """每个请求处理完成后立即作为一条SSE事件发出，不等待同批次的其他请求。
+
+    处理过程中产生的请求级通知（进度、中间结果）也按产生顺序写入同一条流。
+    """
+    dispatch = _bounded_dispatcher(session_id)
+    outbox: asyncio.Queue = asyncio.Queue()
+
+    async def run(message: Dict[str, Any]) -> None:
+        response = None
+        try:
+            bind_request_notifier(outbox.put_nowait)
+            response = await dispatch(message)
+        finally:
+            outbox.put_nowait(_RESPONSE_DONE if response is None else response)
+
+    tasks = [asyncio.create_task(run(message)) for message in requests]
+    fallback_ids = itertools.count()
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await outbox.get()
+            if item is _RESPONSE_DONE:
+                remaining -= 1
+                continue
+            if isinstance(item, MCPMessage):
+                remaining -= 1
+                item = item.to_dict()
+            yield {
+                "event": "message",
+                "data": dumps(item),
+                "id": _next_event_id(session_id, fallback_ids),
+            }
+    finally:
+        # 客户端提前断开时取消尚未完成的请求
+        for task in tasks:
+            task.cancel()
+
+
+# 请求处理完成但没有响应（如已被取消）的标记
+_RESPONSE_DONE = object()
 
 
 @app.post("/mcp")
@@ -211,17 +216,29 @@ async def handle_mcp_post(
             },
         )
 
+    # 会话已过期、被淘汰或删除时返回404，客户端需重新initialize
+    if mcp_session_id and not sessions.touch(mcp_session_id):
+        return JSONResponse(status_code=404, content={"error": "Session not found"})
+
     try:
         # 读取请求体
         body = await request.json()
-        logger.info(
-            f"MCP POST request: {json.dumps(body) if isinstance(body, dict) else f'Batch of {len(body)} messages'}"
-        )
+        if _sample_request_log():
+            # 使用%s延迟格式化，不在请求路径上重新序列化请求体
+            logger.info(
+                "MCP POST request: %s",
+                body if isinstance(body, dict) else f"Batch of {len(body)} messages",
+            )
 
         # 判断是否为批量请求
         is_batch = isinstance(body, list)
         messages = body if is_batch else [body]
 
+        # 先处理通知（如notifications/cancelled），通知不产生响应
+        for msg in messages:
+            if msg.get("id") is None and msg.get("method"):
+                await protocol.handle_message(msg, scope=mcp_session_id)
+
         # 检查是否包含请求（有id的消息）
         has_requests = any(msg.get("id") is not None for msg in messages)
 
@@ -230,58 +247,39 @@ async def handle_mcp_post(
             logger.info("No requests in body, returning 202 Accepted")
             return Response(status_code=202)
 
-        # 处理所有消息
-        responses = []
+        # 只处理有id的消息
+        requests = [msg for msg in messages if msg.get("id") is not None]
+
+        # 初始化请求在处理前就建立session：SSE模式下响应头先于结果发出
         session_id = mcp_session_id
+        if not session_id:
+            initialize = next((msg for msg in requests if msg.get("method") == "initialize"), None)
+            if initialize is not None:
+                session_id = _create_session(initialize)
 
-        for message in messages:
-            if message.get("id") is not None:  # 只处理请求
-                response = await protocol.handle_message(message)
-                if response:
-                    # 特殊处理初始化请求
-                    if message.get("method") == "initialize" and not session_id:
-                        session_id = str(uuid.uuid4())
-                        sessions[session_id] = {
-                            "created_at": asyncio.get_event_loop().time(),
-                            "client_info": message.get("params", {}).get(
-                                "clientInfo", {}
-                            ),
-                        }
-                        logger.info(f"Created new session: {session_id}")
-
-                    responses.append(response.to_dict())
+        headers = {}
+        if session_id:
+            headers["Mcp-Session-Id"] = session_id
 
         # 根据Accept头决定响应格式
         use_sse = accept and "text/event-stream" in accept
 
-        if use_sse and responses:
-            # 返回SSE流
-            async def generate_sse():
-                for response in responses:
-                    event_data = json.dumps(response)
-                    yield {
-                        "event": "message",
-                        "data": event_data,
-                        "id": str(uuid.uuid4()),
-                    }
+        if use_sse:
+            # 返回SSE流，结果按完成顺序逐条发出
+            return EventSourceResponse(_stream_responses(requests, session_id), headers=headers)
 
-            headers = {}
-            if session_id:
-                headers["Mcp-Session-Id"] = session_id
+        # 并发处理所有请求，结果按原顺序返回
+        results = await _dispatch_concurrently(requests, session_id)
+        responses = [response.to_dict() for response in results if response]
 
-            return EventSourceResponse(generate_sse(), headers=headers)
-        else:
-            # 返回JSON
-            headers = {}
-            if session_id:
-                headers["Mcp-Session-Id"] = session_id
+        # 全部请求都被客户端取消时没有可返回的响应
+        if not responses:
+            return Response(status_code=202, headers=headers)
 
-            # 单个请求返回单个响应，批量请求返回数组
-            content = (
-                responses[0] if not is_batch and len(responses) == 1 else responses
-            )
+        # 单个请求返回单个响应，批量请求返回数组
+        content = responses[0] if not is_batch and len(responses) == 1 else responses
 
-            return JSONResponse(content=content, headers=headers)
+        return FastJSONResponse(content=content, headers=headers)
 
     except json.JSONDecodeError:
         return JSONResponse(
@@ -325,37 +323,54 @@ async def handle_mcp_get(
         )
 
     # 验证session（如果提供）
-    if mcp_session_id and mcp_session_id not in sessions:
+    if mcp_session_id and not sessions.touch(mcp_session_id):
         return JSONResponse(status_code=404, content={"error": "Session not found"})
 
+    # 断线重连：补发会话缓冲区中Last-Event-ID之后的事件
+    resume_after: Optional[int] = None
+    if mcp_session_id and last_event_id:
+        try:
+            resume_after = int(last_event_id)
+        except ValueError:
+            resume_after = None
+
     async def event_stream():
         """生成SSE事件流"""
+        # 先订阅再补发，补发期间产生的新事件不会丢失
+        subscriber = event_store.subscribe(mcp_session_id)
         try:
-            event_id = 0
+            last_sent = -1
+            if resume_after is not None:
+                for event in event_store.replay(mcp_session_id, resume_after):
+                    yield format_sse_event(event)
+                    last_sent = event[0]
 
-            # 处理断线重连
-            if last_event_id:
+            while True:
                 try:
-                    event_id = int(last_event_id) + 1
-                except ValueError:
-                    event_id = 0
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=SSE_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    # 空闲时发送心跳（不分配事件id，不进入缓冲区）
+                    yield {
+                        "event": "ping",
+                        "data": json.dumps(
+                            {"type": "ping", "timestamp": asyncio.get_event_loop().time()}
+                        ),
+                    }
+                    continue
 
-            while True:
-                # 每30秒发送心跳
-                yield {
-                    "event": "ping",
-                    "data": json.dumps(
-                        {"type": "ping", "timestamp": asyncio.get_event_loop().time()}
-                    ),
-                    "id": str(event_id),
-                }
-                event_id += 1
-
-                await asyncio.sleep(30)
+                if event is None:
+                    # 会话被移除或客户端消费过慢，关闭连接
+                    logger.info(f"Closing SSE stream for session: {mcp_session_id}")
+                    return
+                if event[0] is not None and event[0] <= last_sent:
+                    continue  # 已在补发中发送过
+                yield format_sse_event(event)
 
         except asyncio.CancelledError:
             logger.info("SSE connection closed")
             raise
+        finally:
+            event_store.unsubscribe(subscriber)
 
     return EventSourceResponse(event_stream())
 
@@ -370,8 +385,7 @@ async def handle_mcp_delete(mcp_session_id: Optional[str] = Header(None)):
             status_code=400, content={"error": "Mcp-Session-Id header required"}
         )
 
-    if mcp_session_id in sessions:
-        del sessions[mcp_session_id]
+    if sessions.delete(mcp_session_id):
         logger.info(f"Deleted session: {mcp_session_id}")
         return Response(status_code=204)
     else:
@@ -410,7 +424,13 @@ async def health_check():
     return {
         "status": "healthy",
         "transport": "streamable-http",
-        "sessions": len(sessions),
+        "sessions": sessions.stats(),
+        "events": event_store.stats(),
+        "catalog_notifier": change_notifier.stats(),
+        "fragment_cache": search_service.fragments.stats(),
+        "requests": {"in_flight": len(protocol.in_flight), "cancelled": protocol.cancelled},
+        "result_cache": search_service.result_cache.stats(),
+        "catalog_snapshot": search_service.snapshot_publisher.stats() if search_service.snapshot_publisher else None,
     }
 
 
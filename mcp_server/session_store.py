@@ -0,0 +1,382 @@
+"""
+MCP会话存储 - 容量上限、空闲TTL、LRU淘汰与定期清理
+
+默认使用进程内存储；多个MCP worker进程需要共享会话时可切换为本地SQLite文件。
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 会话被移除时的回调：(session_id, reason)，reason为 expired / evicted / deleted
+RemovalListener = Callable[[str, str], None]
+
+
+class SessionStore(ABC):
+    """会话存储接口。
+
+    get/touch 会刷新会话的最近访问时间；超过TTL未访问的会话视为不存在，
+    由 sweep() 或下一次访问时移除。会话数超过上限时淘汰最久未访问的会话。
+    """
+
+    def __init__(self, max_sessions: int, ttl: float):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.expired = 0
+        self.evicted = 0
+        self._listeners: List[RemovalListener] = []
+
+    def subscribe(self, listener: RemovalListener) -> None:
+        """注册会话移除回调"""
+        self._listeners.append(listener)
+
+    @abstractmethod
+    def create(self, session_id: str, data: Dict[str, Any]) -> None:
+        """新建会话"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话并刷新访问时间，不存在或已过期返回None"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """删除会话，返回会话是否存在"""
+
+    @abstractmethod
+    def next_event_id(self, session_id: str) -> Optional[int]:
+        """分配会话内单调递增的SSE事件id，会话不存在返回None"""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """移除全部过期会话，返回移除数量"""
+
+    async def sweep_async(self) -> int:
+        """供后台任务调用的sweep；移除回调总是在事件循环线程中执行"""
+        return self.sweep()
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def touch(self, session_id: str) -> bool:
+        """刷新访问时间，返回会话是否仍然有效"""
+        return self.get(session_id) is not None
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "active": len(self),
+            "max": self.max_sessions,
+            "ttl": self.ttl,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+    def _notify(self, session_id: str, reason: str) -> None:
+        if reason == "expired":
+            self.expired += 1
+        elif reason == "evicted":
+            self.evicted += 1
+        for listener in self._listeners:
+            try:
+                listener(session_id, reason)
+            except Exception as e:
+                logger.error(f"Session removal listener failed for {session_id}: {e}")
+
+
+class InMemorySessionStore(SessionStore):
+    """进程内会话存储，按最近访问顺序保存在OrderedDict中"""
+
+    backend = "memory"
+
+    def __init__(self, max_sessions: int, ttl: float):
+        super().__init__(max_sessions, ttl)
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def create(self, session_id: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        self._sessions[session_id] = {**data, "created_at": now, "last_seen": now, "next_event_id": 0}
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, _ = self._sessions.popitem(last=False)
+            self._notify(evicted_id, "evicted")
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.time()
+        if now - session["last_seen"] > self.ttl:
+            del self._sessions[session_id]
+            self._notify(session_id, "expired")
+            return None
+        session["last_seen"] = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        if self._sessions.pop(session_id, None) is None:
+            return False
+        self._notify(session_id, "deleted")
+        return True
+
+    def next_event_id(self, session_id: str) -> Optional[int]:
+        session = self.get(session_id)
+        if session is None:
+            return None
+        event_id = session["next_event_id"]
+        session["next_event_id"] = event_id + 1
+        return event_id
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.ttl
+        expired = []
+        # 按访问顺序排列，遇到第一个未过期的会话即可停止
+        for session_id, session in self._sessions.items():
+            if session["last_seen"] >= cutoff:
+                break
+            expired.append(session_id)
+        for session_id in expired:
+            del self._sessions[session_id]
+            self._notify(session_id, "expired")
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """基于本地SQLite文件的会话存储，可被同一主机上的多个worker进程共享。
+
+    请求路径上的写入做了合并，避免每个请求都在事件循环中等待SQLite写锁：
+    touch在 touch_interval 内复用本进程上一次的确认结果；SSE事件id按块预留，
+    块用完或会话超过 touch_interval 未确认时才访问数据库。其他进程删除的会话最多在
+    touch_interval 之后被本进程察觉。淘汰/过期计数只统计本进程执行的移除。
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        path: str,
+        max_sessions: int,
+        ttl: float,
+        touch_interval: float = settings.MCP_SESSION_TOUCH_INTERVAL,
+        id_block: int = settings.MCP_SESSION_EVENT_ID_BLOCK,
+    ):
+        super().__init__(max_sessions, ttl)
+        self.path = path
+        self.touch_interval = min(touch_interval, ttl / 2)
+        self.id_block = max(1, id_block)
+        # 本进程最近一次确认会话有效（同时写入了last_seen）的时间
+        self._validated: Dict[str, float] = {}
+        # 会话 -> 本进程预留的事件id区间 [next, end)
+        self._id_blocks: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mcp_sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                next_event_id INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_mcp_sessions_last_seen ON mcp_sessions (last_seen)")
+
+    def create(self, session_id: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO mcp_sessions (id, data, created_at, last_seen, next_event_id) "
+                    "VALUES (?, ?, ?, ?, 0)",
+                    (session_id, json.dumps(data, ensure_ascii=False), now, now),
+                )
+                evicted = [
+                    row[0]
+                    for row in self._conn.execute(
+                        "SELECT id FROM mcp_sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?",
+                        (self.max_sessions,),
+                    )
+                ]
+                self._delete_ids(evicted)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for evicted_id in evicted:
+            self._notify(evicted_id, "evicted")
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE mcp_sessions SET last_seen = ? WHERE id = ? AND last_seen >= ? "
+                "RETURNING data, created_at, last_seen, next_event_id",
+                (now, session_id, now - self.ttl),
+            ).fetchone()
+        if row is None:
+            self._expire_if_stale(session_id)
+            return None
+        self._validated[session_id] = now
+        data, created_at, last_seen, next_event_id = row
+        return {**json.loads(data), "created_at": created_at, "last_seen": last_seen, "next_event_id": next_event_id}
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM mcp_sessions WHERE id = ?", (session_id,)).rowcount
+        if not deleted:
+            return False
+        self._notify(session_id, "deleted")
+        return True
+
+    def touch(self, session_id: str) -> bool:
+        if self._recently_validated(session_id):
+            return True
+        return self.get(session_id) is not None
+
+    def next_event_id(self, session_id: str) -> Optional[int]:
+        block = self._id_blocks.get(session_id)
+        if block is not None and block[0] < block[1] and self._recently_validated(session_id):
+            self._id_blocks[session_id] = (block[0] + 1, block[1])
+            return block[0]
+
+        now = time.time()
+        with self._lock:
+            # 单条UPDATE ... RETURNING在SQLite中是原子的，多进程并发预留的区间不会重叠
+            row = self._conn.execute(
+                "UPDATE mcp_sessions SET next_event_id = next_event_id + ?, last_seen = ? "
+                "WHERE id = ? AND last_seen >= ? RETURNING next_event_id - ?",
+                (self.id_block, now, session_id, now - self.ttl, self.id_block),
+            ).fetchone()
+        if row is None:
+            self._expire_if_stale(session_id)
+            return None
+        self._validated[session_id] = now
+        self._id_blocks[session_id] = (row[0] + 1, row[0] + self.id_block)
+        return row[0]
+
+    def sweep(self) -> int:
+        expired = self._delete_expired()
+        for session_id in expired:
+            self._notify(session_id, "expired")
+        return len(expired)
+
+    async def sweep_async(self) -> int:
+        # 删除在线程中执行，回到事件循环后再通知（监听器会操作asyncio队列）
+        expired = await asyncio.to_thread(self._delete_expired)
+        for session_id in expired:
+            self._notify(session_id, "expired")
+        cutoff = time.time() - self.touch_interval
+        for session_id in [sid for sid, seen in self._validated.items() if seen < cutoff]:
+            # 可能已被其他进程删除，下次访问时重新确认
+            self._forget(session_id)
+        return len(expired)
+
+    def _delete_expired(self) -> List[str]:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            return [
+                row[0]
+                for row in self._conn.execute(
+                    "DELETE FROM mcp_sessions WHERE last_seen < ? RETURNING id", (cutoff,)
+                ).fetchall()
+            ]
+
+    def _recently_validated(self, session_id: str) -> bool:
+        validated = self._validated.get(session_id)
+        return validated is not None and time.time() - validated < self.touch_interval
+
+    def _forget(self, session_id: str) -> None:
+        self._validated.pop(session_id, None)
+        self._id_blocks.pop(session_id, None)
+
+    def _notify(self, session_id: str, reason: str) -> None:
+        self._forget(session_id)
+        super()._notify(session_id, reason)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM mcp_sessions").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _delete_ids(self, session_ids: List[str]) -> None:
+        if session_ids:
+            placeholders = ",".join("?" * len(session_ids))
+            self._conn.execute(f"DELETE FROM mcp_sessions WHERE id IN ({placeholders})", session_ids)
+
+    def _expire_if_stale(self, session_id: str) -> None:
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM mcp_sessions WHERE id = ? AND last_seen < ?",
+                (session_id, time.time() - self.ttl),
+            ).rowcount
+        if deleted:
+            self._notify(session_id, "expired")
+
+
+def create_session_store() -> SessionStore:
+    """按配置创建会话存储"""
+    if settings.MCP_SESSION_STORE == "sqlite":
+        logger.info(f"Using SQLite session store at {settings.MCP_SESSION_DB_PATH}")
+        return SQLiteSessionStore(settings.MCP_SESSION_DB_PATH, settings.MCP_SESSION_MAX, settings.MCP_SESSION_TTL)
+    if settings.MCP_SESSION_STORE != "memory":
+        logger.warning(f"Unknown MCP_SESSION_STORE '{settings.MCP_SESSION_STORE}', using in-memory store")
+    return InMemorySessionStore(settings.MCP_SESSION_MAX, settings.MCP_SESSION_TTL)
+
+
+class SessionSweeper:
+    """定期清理过期会话的后台任务"""
+
+    def __init__(self, store: SessionStore, interval: float = settings.MCP_SESSION_SWEEP_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """启动清理任务（幂等）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="mcp-session-sweeper")
+        return self._task
+
+    async def stop(self) -> None:
+        """停止清理任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                removed = await self.store.sweep_async()
+            except Exception as e:
+                logger.error(f"Error sweeping MCP sessions: {e}")
+                continue
+            if removed:
+                logger.info(f"Swept {removed} expired MCP session(s)")
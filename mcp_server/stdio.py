@@ -0,0 +1,161 @@
+"""
+MCP stdio传输 - 从标准输入逐行读取JSON-RPC消息，向标准输出逐行写回响应和通知
+
+与HTTP服务共用 MCPProtocol 和工具处理器，但不导入FastAPI/uvicorn，适合由客户端按需拉起。
+每行是一条消息或一个批量数组；请求并发执行，完成即写回（批量请求全部完成后写回一个数组）。
+标准输出只用于协议消息，日志及其他输出一律写入标准错误。
+
+用法：python -m mcp_server.stdio
+"""
+import asyncio
+import json
+import logging
+import sys
+from typing import Any, BinaryIO, Dict, List, Optional, Set
+
+from backend.config import settings
+from mcp_server.change_notifier import CatalogChangeNotifier
+from mcp_server.progress import bind_request_notifier
+from mcp_server.protocol import MCPMessage, MCPProtocol
+from mcp_server.serialization import dumps_bytes
+from mcp_server.tools import register_tools, search_service
+
+logger = logging.getLogger(__name__)
+
+protocol = MCPProtocol()
+register_tools(protocol)
+
+
+def _error(code: int, message: str, request_id: Any = None) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "error": {"code": code, "message": message}, "id": request_id}
+
+
+class StdioTransport:
+    """行分隔JSON-RPC传输，单个连接内最多并发 MCP_BATCH_CONCURRENCY 个请求"""
+
+    def __init__(self, protocol: MCPProtocol, output: BinaryIO):
+        self.protocol = protocol
+        self._output = output
+        self._semaphore = asyncio.Semaphore(max(1, settings.MCP_BATCH_CONCURRENCY))
+        self._tasks: Set[asyncio.Task] = set()
+        # 一个stdio连接就是一个客户端，用固定的scope登记可取消的请求
+        self._scope = f"stdio-{id(self)}"
+
+    def send(self, message: Any) -> None:
+        """写出一条消息（一行）"""
+        self._output.write(dumps_bytes(message) + b"\n")
+        self._output.flush()
+
+    def notify(self, method: str, params: Optional[Dict[str, Any]] = None) -> None:
+        self.send(MCPMessage(method=method, params=params).to_dict())
+
+    async def run(self, input_stream: BinaryIO) -> None:
+        """读取到EOF为止，随后等待尚未完成的请求"""
+        while True:
+            # 线程中阻塞读取，对管道和重定向的文件都适用
+            line = await asyncio.to_thread(input_stream.readline)
+            if not line:
+                break
+            if line.strip():
+                await self.handle_line(line)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def handle_line(self, line: bytes) -> None:
+        try:
+            body = json.loads(line)
+        except ValueError:
+            self.send(_error(-32700, "Parse error"))
+            return
+
+        is_batch = isinstance(body, list)
+        messages = body if is_batch else [body]
+        if not messages:
+            self.send(_error(-32600, "Invalid Request"))
+            return
+
+        invalid = [_error(-32600, "Invalid Request") for msg in messages if not isinstance(msg, dict)]
+        messages = [msg for msg in messages if isinstance(msg, dict)]
+
+        # 通知（如notifications/cancelled）在读取循环中直接处理，不等待正在执行的请求
+        for msg in messages:
+            if msg.get("id") is None and msg.get("method"):
+                await self.protocol.handle_message(msg, scope=self._scope)
+
+        requests = [msg for msg in messages if msg.get("id") is not None]
+        if is_batch:
+            if requests:
+                self._spawn(self._answer_batch(requests, invalid))
+            elif invalid:
+                self.send(invalid)
+        elif invalid:
+            self.send(invalid[0])
+        elif requests:
+            self._spawn(self._answer(requests[0]))
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, message: Dict[str, Any]) -> Optional[MCPMessage]:
+        async with self._semaphore:
+            # 进度与中间结果通知直接写到标准输出
+            bind_request_notifier(self.send)
+            return await self.protocol.handle_message(message, scope=self._scope)
+
+    async def _answer(self, message: Dict[str, Any]) -> None:
+        response = await self._dispatch(message)
+        if response is not None:
+            self.send(response.to_dict())
+
+    async def _answer_batch(self, requests: List[Dict[str, Any]], invalid: List[Dict[str, Any]]) -> None:
+        results = await asyncio.gather(*(self._dispatch(message) for message in requests))
+        responses = [response.to_dict() for response in results if response] + invalid
+        if responses:
+            self.send(responses)
+
+
+async def serve() -> None:
+    output = sys.stdout.buffer
+    # 存储层等模块仍使用print，全部转到标准错误，避免破坏协议输出
+    sys.stdout = sys.stderr
+
+    transport = StdioTransport(protocol, output)
+    change_notifier = CatalogChangeNotifier(search_service.storage_service, transport.notify)
+
+    publisher = search_service.snapshot_publisher
+    if publisher is not None:
+        # 共享快照：未被其他进程持有锁时由本进程写入（同时启动目录监听）
+        await publisher.start()
+    elif not settings.USE_DATABASE:
+        from backend.services.prompt_catalog import get_prompt_catalog
+        from backend.services.prompt_watcher import start_prompt_watcher
+
+        start_prompt_watcher(get_prompt_catalog(settings.PROMPT_TEMPLATE_DIR))
+    await change_notifier.start()
+    logger.info("MCP stdio transport ready")
+
+    try:
+        await transport.run(sys.stdin.buffer)
+    finally:
+        from backend.services.prompt_watcher import stop_prompt_watchers
+
+        await change_notifier.stop()
+        if publisher is not None:
+            await publisher.stop()
+        await stop_prompt_watchers()
+        # 退出前写入尚未落盘的使用次数
+        await search_service.usage_recorder.stop()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
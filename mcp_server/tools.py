@@ -0,0 +1,219 @@
+"""
+MCP工具定义与方法处理器 - HTTP与stdio传输共用
+
+本模块不依赖FastAPI，stdio入口只导入这里即可注册全部方法。
+"""
+import logging
+import random
+from typing import Any, Dict
+
+from backend.config import settings
+from mcp_server.change_notifier import CATALOG_CHANGED_METHOD
+from mcp_server.progress import get_progress_reporter
+from mcp_server.protocol import MCPProtocol
+from mcp_server.search_service import SearchService
+from mcp_server.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+search_service = SearchService()
+
+# 定义工具列表
+TOOLS = [
+    {
+        "name": "search_prompts",
+        "description": "搜索prompt模板，支持按标题、标签和内容搜索",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "搜索关键词"},
+                "search_in": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "搜索范围：title, tags, content",
+                    "default": ["title", "tags", "content"],
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "返回结果数量限制",
+                    "default": 20,
+                    "minimum": 1,
+                    "maximum": 100,
+                },
+                "ranking": {
+                    "type": "string",
+                    "enum": ["priority", "bm25"],
+                    "description": "排序方式：priority按标题>标签>内容分档，bm25按相关度排序",
+                    "default": "priority",
+                },
+            },
+            "required": ["query"],
+        },
+    },
+    {
+        "name": "get_prompt_names",
+        "description": "分页获取可用的prompt名称列表，还有下一页时结果包含nextCursor",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "cursor": {
+                    "type": "string",
+                    "description": "上一页返回的nextCursor，留空从第一页开始",
+                },
+                "page_size": {
+                    "type": "integer",
+                    "description": "每页条数",
+                    "default": 100,
+                    "minimum": 1,
+                    "maximum": 500,
+                },
+            },
+            "required": [],
+        },
+    },
+    {
+        "name": "get_prompt_by_title",
+        "description": "根据标题获取具体的prompt内容",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"title": {"type": "string", "description": "prompt标题"}},
+            "required": ["title"],
+        },
+    },
+    {
+        "name": "get_prompts_by_titles",
+        "description": "根据标题列表批量获取多个prompt，未找到的标题在对应结果项中标明",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "titles": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "prompt标题列表",
+                    "minItems": 1,
+                    "maxItems": 500,
+                }
+            },
+            "required": ["titles"],
+        },
+    },
+    {
+        "name": "list_prompts_by_tag",
+        "description": "分页列出指定标签的prompts，还有下一页时结果包含nextCursor",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "tags": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "按标签过滤，留空返回所有prompts",
+                },
+                "fields": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": ["title", "content", "tags", "remark"]},
+                    "description": "只返回指定字段，例如 [\"title\", \"tags\"] 不返回内容",
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "上一页返回的nextCursor，留空从第一页开始",
+                },
+                "page_size": {
+                    "type": "integer",
+                    "description": "每页条数",
+                    "default": 100,
+                    "minimum": 1,
+                    "maximum": 500,
+                },
+            },
+            "required": [],
+        },
+    },
+]
+
+
+# MCP方法处理器
+async def handle_initialize(params: Dict[str, Any]) -> Dict[str, Any]:
+    """处理初始化请求"""
+    client_info = params.get("clientInfo", {})
+    logger.info(f"Initializing for client: {client_info.get('name', 'unknown')}")
+
+    return {
+        "protocolVersion": "2024-11-05",
+        "serverInfo": {"name": "prompt-management-mcp", "version": "1.0.0"},
+        "capabilities": {
+            "tools": {},  # 声明支持工具
+            # 目录变更作为服务端通知推送（HTTP为GET /mcp 的SSE流，stdio为标准输出），客户端可据此停止轮询
+            "experimental": {"promptCatalogChanged": {"method": CATALOG_CHANGED_METHOD}},
+            # 不声明不支持的功能
+        },
+    }
+
+
+async def handle_tools_list(params: Dict[str, Any]) -> Dict[str, Any]:
+    """处理工具列表请求"""
+    return {"tools": TOOLS}
+
+
+def _text_result(payload: Any) -> Dict[str, Any]:
+    """工具结果以紧凑JSON文本返回；MCP_PRETTY_JSON开启时缩进输出"""
+    return {"content": [{"type": "text", "text": dumps(payload, pretty=settings.MCP_PRETTY_JSON)}]}
+
+
+def _sample_request_log() -> bool:
+    """按 MCP_REQUEST_LOG_SAMPLE_RATE 抽样记录请求内容"""
+    rate = settings.MCP_REQUEST_LOG_SAMPLE_RATE
+    return rate > 0 and logger.isEnabledFor(logging.INFO) and (rate >= 1 or random.random() < rate)
+
+
+async def handle_tools_call(params: Dict[str, Any]) -> Any:
+    """处理工具调用请求"""
+    tool_name = params.get("name")
+    tool_args = params.get("arguments", {})
+
+    if _sample_request_log():
+        logger.info("Tool call: %s with args: %s", tool_name, tool_args)
+
+    try:
+        if tool_name == "search_prompts":
+            # 客户端提供了progressToken且传输支持请求级通知时推送搜索进度
+            results = await search_service.search_prompts(tool_args, reporter=get_progress_reporter(params))
+            return _text_result({"results": results})
+
+        elif tool_name == "get_prompt_names":
+            page = await search_service.get_prompt_names(tool_args)
+            return _text_result(page)
+
+        elif tool_name == "get_prompt_by_title":
+            prompt = await search_service.get_prompt(tool_args)
+            if prompt:
+                return _text_result({"prompt": prompt})
+            else:
+                return {
+                    "content": [{"type": "text", "text": "Prompt not found"}],
+                    "isError": True,
+                }
+
+        elif tool_name == "get_prompts_by_titles":
+            results = await search_service.get_prompts(tool_args)
+            return _text_result({"results": results})
+
+        elif tool_name == "list_prompts_by_tag":
+            page = await search_service.list_prompts(tool_args)
+            return _text_result(page)
+
+        else:
+            raise ValueError(f"Unknown tool: {tool_name}")
+
+    except Exception as e:
+        logger.error(f"Tool execution error: {e}", exc_info=True)
+        return {
+            "content": [{"type": "text", "text": f"Error: {str(e)}"}],
+            "isError": True,
+        }
+
+
+def register_tools(protocol: MCPProtocol) -> None:
+    """注册 initialize / tools/list / tools/call 处理器"""
+    protocol.register_handler("initialize", handle_initialize)
+    protocol.register_handler("tools/list", handle_tools_list)
+    protocol.register_handler("tools/call", handle_tools_call)
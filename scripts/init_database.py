@@ -9,7 +9,12 @@ from pathlib import Path
 # 添加项目根目录到Python路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+
 from backend.database import async_engine, Base
+from backend.db_models import Prompt
+from backend.services.db_service import DatabaseService
 
 
 async def init_database():
@@ -20,13 +25,23 @@ async def init_database():
         async with async_engine.begin() as conn:
             # 创建所有表
             await conn.run_sync(Base.metadata.create_all)
+            # create_all不会为已存在的表补建索引：对已有数据库逐个幂等创建
+            await conn.execute(text("DROP INDEX IF EXISTS idx_prompts_updated_title"))  # 旧版本的升序索引
+            for index in Prompt.__table__.indexes:
+                await conn.execute(CreateIndex(index, if_not_exists=True))
         
         print("✅ Database tables created successfully!")
+
+        # 已有提示词但尚无BM25统计时（从旧版本升级）建立统计
+        await DatabaseService().rebuild_search_stats(if_missing=True)
         print("\nCreated tables:")
         print("- users")
         print("- tags") 
         print("- prompts")
         print("- prompt_tags")
+        print("- catalog_state")
+        print("- search_field_stats")
+        print("- search_term_stats")
         
     except Exception as e:
         print(f"❌ Error initializing database: {e}")
@@ -282,6 +282,9 @@ class DataMigrator:
             
             # 4. 迁移提示词
             await self.migrate_prompts(tag_name_to_id)
+
+            # 迁移直接写入提示词表，完成后重建BM25搜索统计
+            await self.db_service.rebuild_search_stats()
             
             # 5. 验证迁移结果
             await self.verify_migration()